@@ -0,0 +1,203 @@
+import bisect
+import itertools
+import threading
+import numpy as np
+
+
+class Thresholds:
+    """
+    Alerts on one contract kept sorted by threshold in cents
+    """
+
+    def __init__(self):
+        self.values = []
+        self.alerts = []
+
+    def add(self, value, alert):
+        i = bisect.bisect_right(self.values, value)
+        self.values.insert(i, value)
+        self.alerts.insert(i, alert)
+
+    def pop_below(self, value):
+        """
+        Remove and return every alert with a threshold at or below value
+        """
+        i = bisect.bisect_right(self.values, value)
+        fired = self.alerts[:i]
+        del self.values[:i]
+        del self.alerts[:i]
+        return fired
+
+    def pop_above(self, value):
+        """
+        Remove and return every alert with a threshold at or above value
+        """
+        i = bisect.bisect_left(self.values, value)
+        fired = self.alerts[i:]
+        del self.values[i:]
+        del self.alerts[i:]
+        return fired
+
+    def __len__(self):
+        return len(self.values)
+
+
+class AlertEngine:
+    """
+    Price alerts indexed by (market, bin), so a price update only touches the alerts it crosses.
+    A positive value fires when the yes price rises to it, a negative one when it drops to -value.
+    """
+
+    def __init__(self, journal=None, compact_every=1000, listener=None):
+        self.lock = threading.Lock()
+        self.journal = journal
+        self.listener = listener
+        self.compact_every = compact_every
+        self.rising = {}
+        self.falling = {}
+        self.market_bins = {}
+        self.fresh = set()
+        self.outbox = {}
+        self.ids = itertools.count()
+        if journal is not None:
+            self.restore()
+
+    def restore(self):
+        """
+        Rebuild the alerts and undelivered messages from the journal snapshot and log tail
+        """
+        state, records = self.journal.load()
+        alerts = {}
+        if state is not None:
+            alerts = {alert['id']: alert for alert in state['alerts']}
+            self.outbox = {int(id): msg for id, msg in state['outbox'].items()}
+        for record in records:
+            if record['op'] == 'add':
+                alerts[record['alert']['id']] = record['alert']
+            elif record['op'] == 'fire':
+                alerts.pop(record['id'], None)
+                self.outbox[record['id']] = record['message']
+            elif record['op'] == 'sent':
+                self.outbox.pop(record['id'], None)
+        for alert in alerts.values():
+            self.index(alert)
+        self.ids = itertools.count(max(list(alerts) + list(self.outbox), default=-1) + 1)
+
+    def add(self, user, market, bin, value):
+        alert = {'id': next(self.ids), 'user': user, 'market': market, 'bin': bin, 'value': value}
+        with self.lock:
+            self.index(alert)
+            if self.journal is not None:
+                self.journal.append('add', alert=alert)
+        return alert
+
+    def index(self, alert):
+        key = (str(alert['market']), alert['bin'])
+        value = alert['value']
+        if value < 0:
+            self.falling.setdefault(key, Thresholds()).add(-value, alert)
+        else:
+            self.rising.setdefault(key, Thresholds()).add(value, alert)
+        self.market_bins.setdefault(key[0], set()).add(key[1])
+        self.fresh.add(key)
+
+    def check(self, columns, diff=None):
+        """
+        Fire the alerts crossed by the current prices
+        :param columns: store.Columns of the current snapshot
+        :param diff: SnapshotDiff limiting the check to changed markets, or None to check every market
+        :return: list of (alert id, message) pairs, also kept in the outbox until delivered
+        """
+        messages = []
+        with self.lock:
+            if diff is None:
+                keys = set(itertools.chain(self.rising, self.falling))
+            else:
+                keys = {(market_id, bin) for market_id in diff.changed for bin in self.market_bins.get(market_id, ())}
+                keys |= self.fresh
+            self.fresh = set()
+            keys = list(keys)
+            positions = np.array([columns.position(*key) for key in keys], dtype=np.int64)
+            cents = np.where(positions >= 0, columns.yes[positions] * 100, np.nan)
+            for key, price in zip(keys, cents.tolist()):
+                if price == price:
+                    messages += self.fire(key, price)
+        return messages
+
+    def fire(self, key, cents):
+        messages = []
+        if key in self.falling:
+            for alert in self.falling[key].pop_above(cents):
+                msg = alert['user'] + " Market " + key[0] + " just dropped below " + str(
+                    -alert['value']) + '\n'
+                msg += "Currently at " + str(int(cents)) + '¢'
+                messages.append((alert['id'], msg))
+        if key in self.rising:
+            for alert in self.rising[key].pop_below(cents):
+                msg = alert['user'] + " Market " + key[0] + " just went above " + str(alert['value']) + '\n'
+                msg += "Currently at " + str(int(cents)) + '¢'
+                messages.append((alert['id'], msg))
+        for id, msg in messages:
+            self.send(id, msg)
+        self.prune(key)
+        return messages
+
+    def post(self, msg):
+        """
+        Put a message that is not tied to an alert, such as a negative risk change, in the outbox
+        :return: id of the message
+        """
+        with self.lock:
+            id = next(self.ids)
+            self.send(id, msg)
+        return id
+
+    def send(self, id, msg):
+        self.outbox[id] = msg
+        if self.journal is not None:
+            self.journal.append('fire', id=id, message=msg)
+        if self.listener is not None:
+            self.listener(id, msg)
+
+    def prune(self, key):
+        for index in (self.rising, self.falling):
+            if key in index and not index[key]:
+                del index[key]
+        if key not in self.rising and key not in self.falling:
+            bins = self.market_bins.get(key[0])
+            if bins is not None:
+                bins.discard(key[1])
+                if not bins:
+                    del self.market_bins[key[0]]
+
+    def delivered(self, id):
+        with self.lock:
+            if self.outbox.pop(id, None) is not None and self.journal is not None:
+                self.journal.append('sent', id=id)
+
+    def pending(self):
+        with self.lock:
+            return list(self.outbox.items())
+
+    def flush(self):
+        """
+        Write journaled changes to disk, compacting the log once it grows past compact_every records
+        """
+        if self.journal is None:
+            return
+        self.journal.flush()
+        if self.journal.logged >= self.compact_every:
+            with self.lock:
+                self.journal.compact({'alerts': self.all_alerts(), 'outbox': self.outbox})
+
+    def all_alerts(self):
+        return [alert for index in (self.rising, self.falling) for thresholds in index.values()
+                for alert in thresholds.alerts]
+
+    def watches(self):
+        with self.lock:
+            return self.all_alerts()
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(thresholds) for index in (self.rising, self.falling) for thresholds in index.values())
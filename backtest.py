@@ -0,0 +1,112 @@
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+from alerts import AlertEngine
+from journal import Journal
+from main import optimize_markets
+from store import Columns
+from workers import Workers
+
+
+def load_snapshot(path):
+    """
+    Read a recorded marketdata/all payload, plain or gzipped
+    :return: store.Columns of the snapshot
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return Columns(json.loads(f.read())['markets'])
+
+
+def snapshot_paths(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.endswith('.json') or name.endswith('.json.gz')]
+
+
+def replay_chunk(paths, alerts, max_shares, minimum):
+    """
+    Run the negative risk scan and the alerts over consecutive snapshots in a worker process.
+    A market is only optimized again when its prices moved since the last snapshot it was scanned in.
+    :param paths: snapshot files in time order
+    :param alerts: list of (user, market, bin, value), added in the same order by every chunk so ids match
+    :return: list of (path, list of (market id, sum of 1 minus no, profit) with positive profit, fired alert ids)
+    """
+    engine = AlertEngine()
+    for alert in alerts:
+        engine.add(*alert)
+    memo = {}
+    results = []
+    for path in paths:
+        columns = load_snapshot(path)
+        markets = columns.short_prices(candidates_only=True)
+        moved = [(market_id, short) for market_id, short in markets if memo.get(market_id, (None,))[0] != short]
+        for market, result in zip(moved, optimize_markets(moved, max_shares, minimum)):
+            memo[market[0]] = (market[1], result)
+        found = [memo[market_id][1] for market_id, short in markets if memo[market_id][1][2] > 0]
+        results.append((path, found, [id for id, msg in engine.check(columns)]))
+    return results
+
+
+async def replay(paths, alerts=(), max_shares=850, minimum=False, processes=None, chunks_per_process=4):
+    """
+    Replay snapshots through the analytics on every core. Each worker takes a run of consecutive snapshots,
+    so an alert fires at the earliest snapshot of the first chunk that fires it.
+    :return: (list of (path, opportunities, fired alert ids) in time order, seconds taken)
+    """
+    workers = Workers(processes, timeout=None)
+    size = max(1, -(-len(paths) // (workers.size() * chunks_per_process)))
+    start = time.perf_counter()
+    try:
+        chunks = await asyncio.gather(*[workers.run(replay_chunk, paths[i:i + size], list(alerts), max_shares, minimum)
+                                        for i in range(0, len(paths), size)])
+    finally:
+        workers.close()
+    return [result for chunk in chunks for result in chunk], time.perf_counter() - start
+
+
+def summarize(results, seconds):
+    """
+    Count the opportunities and simulate taking each one when it appears. The profit optimize_spread reports
+    is what the spread pays in the worst outcome after the 10% fee on winnings, so it is the realized P&L.
+    :return: dict of totals
+    """
+    held = set()
+    trades = 0
+    pnl = 0
+    fired = {}
+    for path, found, alert_ids in results:
+        current = set()
+        for market_id, sum_prices, profit in found:
+            current.add(market_id)
+            if market_id not in held:
+                trades += 1
+                pnl += profit
+        held = current
+        for id in alert_ids:
+            fired.setdefault(id, path)
+    return {'snapshots': len(results), 'snapshots_per_second': len(results) / seconds if seconds else 0,
+            'opportunity_snapshots': sum(1 for result in results if result[1]), 'trades': trades,
+            'pnl': round(pnl, 2), 'alerts_fired': len(fired)}
+
+
+def saved_alerts(path):
+    """
+    Current alerts of the bot, read from its journal. Loading never writes, and the engine is never flushed,
+    so the live journal is left as it is even when the bot is halfway through a flush.
+    :param path: alert_path the Api was started with
+    """
+    return [(alert['user'], alert['market'], alert['bin'], alert['value'])
+            for alert in sorted(AlertEngine(Journal(path)).watches(), key=lambda alert: alert['id'])]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python backtest.py SNAPSHOT_DIRECTORY [ALERT_PATH]')
+        sys.exit(1)
+    alerts = saved_alerts(sys.argv[2]) if len(sys.argv) > 2 else []
+    results, seconds = asyncio.get_event_loop().run_until_complete(replay(snapshot_paths(sys.argv[1]), alerts))
+    for name, value in summarize(results, seconds).items():
+        print(name + ': ' + str(round(value, 2)))
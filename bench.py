@@ -0,0 +1,248 @@
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+CORPUS = [
+    ',risk all', ',r 3698', ',risk which party will win the senate 500', ',Risk top 850', ',b 3633',
+    ',bins democratic nominee', ',v 3698 2', ',value dem nominee', ',. sanders', ',. biden++', ',- senate',
+    ',- house control+', ',o 3698', ',o presidential election', ',rcp national', ',p ia', ',alert 3698 1 45',
+    ',a 3633 2 -30', ',stock AAPL', ',s TSLA', ',help', ',h', ',i', ',stats', ',nh manchester', ',hello',
+    ',bye', '!burn', ',tip', 'is anyone else seeing this market move?', 'lol', ',poll', 'https://www.predictit.org',
+    '', ',', ',risk', ',alert 3698 x 45',
+]
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_dispatch(repeat=2000):
+    """
+    Time parsing and routing every message of CORPUS
+    """
+    import discord_bot
+
+    def route():
+        for content in CORPUS:
+            try:
+                discord_bot.router.parse(content)
+            except ValueError:
+                pass
+    per_pass = timed(route, repeat)
+    print('dispatch: ' + str(round(per_pass / len(CORPUS) * 1e6, 2)) + ' us/message over ' + str(len(CORPUS)) + ' messages')
+
+
+def synthetic_marketdata(markets=3000, seed=1):
+    """
+    marketdata/all shaped snapshot with random prices, roughly the size of the live feed
+    """
+    rng = random.Random(seed)
+    contract_id = 0
+    data = []
+    for i in range(markets):
+        contracts = []
+        for bin in range(rng.choice([1, 1, 2, 3, 5, 8, 12, 20, 30])):
+            contract_id += 1
+            no = rng.choice([None, round(rng.uniform(0.5, 0.99), 2), round(rng.uniform(0.8, 0.99), 2)])
+            yes = None if no is None else round(min(0.99, 1.01 - no), 2)
+            contracts.append({'id': contract_id, 'dateEnd': 'N/A', 'image': 'https://example.com/' + str(contract_id),
+                              'name': 'Contract ' + str(bin) + ' of market ' + str(i),
+                              'shortName': 'C' + str(bin), 'status': 'Open', 'lastTradePrice': round(rng.random(), 2),
+                              'bestBuyYesCost': yes, 'bestBuyNoCost': no, 'bestSellYesCost': None,
+                              'bestSellNoCost': None, 'lastClosePrice': round(rng.random(), 2), 'displayOrder': bin})
+        data.append({'id': 1000 + i, 'name': 'Which candidate will win race ' + str(i) + '?',
+                     'shortName': 'Race ' + str(i), 'image': 'https://example.com/m' + str(i),
+                     'url': 'https://example.com/markets/' + str(i), 'contracts': contracts,
+                     'timeStamp': '2020-01-01T00:00:00', 'status': 'Open'})
+    return {'markets': data}
+
+
+def deep_size(value):
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(deep_size(k) + deep_size(v) for k, v in value.items())
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(deep_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def bench_columns(markets=3000, repeat=3):
+    """
+    Compare the memory of the parsed json with the price columns, and the full scan with the prefiltered one
+    """
+    import main
+    from store import Columns, MarketStore
+
+    data = synthetic_marketdata(markets)
+    columns = Columns(data['markets'])
+    print('columns: ' + str(round(deep_size(data) / 2 ** 20, 1)) + ' MiB as dicts, '
+          + str(round(columns.nbytes() / 2 ** 20, 2)) + ' MiB as columns')
+    store = MarketStore(data)
+    for candidates_only in (False, True):
+        short = store.short_prices(candidates_only=candidates_only)
+        per_scan = timed(lambda: main.optimize_markets(short, 850, False), repeat)
+        print('columns: scan of ' + str(len(short)) + ' markets in ' + str(round(per_scan * 1000, 1)) + ' ms'
+              + (' after prefilter' if candidates_only else ''))
+
+
+def parse_child(parser, path):
+    """
+    Load one payload into a MarketStore in this process and print time and peak rss growth
+    """
+    from store import MarketStore, parse_marketdata
+
+    with open(path, 'rb') as f:
+        body = f.read()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    data = json.loads(body) if parser == 'json' else parse_marketdata(body)
+    MarketStore(data)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': elapsed, 'rss': (after - before) / 1024}))
+
+
+def bench_parse(path=None, markets=3000):
+    """
+    Compare a plain json.loads of marketdata/all with parse_marketdata, each in a fresh process
+    :param path: recorded payload, a synthetic one is written when None
+    """
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'marketdata.json')
+        with open(path, 'w') as f:
+            json.dump(synthetic_marketdata(markets), f)
+    print('parse: ' + str(round(os.path.getsize(path) / 2 ** 20, 1)) + ' MiB payload')
+    for parser in ('json', 'trimmed'):
+        output = subprocess.run([sys.executable, __file__, '--parse-child', parser, path], capture_output=True,
+                                check=True, text=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        print('parse: ' + parser + ' ' + str(round(result['seconds'] * 1000)) + ' ms, peak rss +'
+              + str(round(result['rss'], 1)) + ' MiB')
+
+
+def bench_history(days=30, markets=500, interval=60, moving=0.02):
+    """
+    Record a month of snapshots taken every interval seconds, with a fraction of the contracts moving a cent
+    each time, then time market queries over a day and over the whole month
+    """
+    import numpy as np
+    from history import History
+    from store import Columns
+
+    rng = np.random.default_rng(1)
+    columns = Columns(synthetic_marketdata(markets)['markets'])
+    history = History(tempfile.mkdtemp())
+    start = 1577836800
+    count = days * 24 * 3600 // interval
+    began = time.perf_counter()
+    for i in range(count):
+        moved = rng.random(len(columns.yes)) < moving
+        step = rng.choice([-0.01, 0.01], int(moved.sum()))
+        columns.yes[moved] = np.clip(columns.yes[moved] + step, 0.01, 0.99)
+        columns.no[moved] = np.clip(columns.no[moved] - step, 0.01, 0.99)
+        history.record(columns, start + i * interval)
+    recorded = time.perf_counter() - began
+    size = history.size()
+    print('history: ' + str(count) + ' snapshots of ' + str(len(columns.yes)) + ' contracts recorded at '
+          + str(round(recorded / count * 1e6)) + ' us each')
+    print('history: ' + str(round(size / 2 ** 20, 1)) + ' MiB on disk, ' + str(round(size / count)) + ' bytes per snapshot, '
+          + str(round(size / days / 2 ** 20, 2)) + ' MiB per day')
+    widest = int(np.argmax(np.diff(columns.offsets)))
+    contract_ids = columns.contract_ids[columns.offsets[widest]:columns.offsets[widest + 1]].tolist()
+    end = start + count * interval
+    for label, since in (('day', end - 24 * 3600), ('month', start)):
+        per_query = timed(lambda: history.contract_series(contract_ids, since, end), 5)
+        print('history: ' + str(len(contract_ids)) + ' contract query over a ' + label + ' in '
+              + str(round(per_query * 1000, 1)) + ' ms')
+
+
+def bench_backtest(snapshots=2000, markets=250, moving=0.05):
+    """
+    Replay synthetic one-minute snapshots with backtest.py and extrapolate to three months
+    """
+    import asyncio
+    import backtest
+
+    rng = random.Random(2)
+    data = synthetic_marketdata(markets)
+    contracts = [contract for market in data['markets'] for contract in market['contracts']
+                 if contract['bestBuyNoCost'] is not None]
+    directory = tempfile.mkdtemp()
+    for i in range(snapshots):
+        for contract in rng.sample(contracts, int(len(contracts) * moving)):
+            contract['bestBuyNoCost'] = round(min(0.99, max(0.01, contract['bestBuyNoCost'] + rng.choice([-0.01, 0.01]))), 2)
+            contract['bestBuyYesCost'] = round(min(0.99, 1.01 - contract['bestBuyNoCost']), 2)
+        with open(os.path.join(directory, str(1577836800 + i * 60) + '.json'), 'w') as f:
+            json.dump(data, f)
+    alerts = [('bench', market['id'], 0, rng.choice([1, -1]) * rng.randint(1, 99)) for market in data['markets']]
+    results, seconds = asyncio.get_event_loop().run_until_complete(
+        backtest.replay(backtest.snapshot_paths(directory), alerts))
+    summary = backtest.summarize(results, seconds)
+    print('backtest: ' + str(summary))
+    print('backtest: three months of one-minute snapshots in '
+          + str(round(90 * 24 * 60 / summary['snapshots_per_second'] / 60, 1)) + ' minutes')
+
+
+def bench_rcp(days=2000, repeat=20):
+    """
+    Time reading the latest average of an RCP historical file against decoding all of it
+    """
+    import rcp
+
+    rng = random.Random(3)
+    averages = [{'date': str(i), 'candidate': [{'name': name, 'value': str(round(rng.uniform(1, 40), 1))}
+                                               for name in ('Biden', 'Sanders', 'Warren', 'Buttigieg')]}
+                for i in range(days)]
+    body = ('return_json(' + json.dumps({'poll': {'rcp_avg': averages}}) + ');').encode()
+    latest = timed(lambda: rcp.parse_average(body), repeat)
+    full = timed(lambda: json.loads(body.decode('utf-8')[12:][:-2])['poll']['rcp_avg'][0], repeat)
+    print('rcp: latest average in ' + str(round(latest * 1e6)) + ' us, full decode in ' + str(round(full * 1e6))
+          + ' us for ' + str(round(len(body) / 1024)) + ' KiB')
+
+
+def bench_startup(markets=3000):
+    """
+    Time importing the bot and starting Api from the snapshot cache, with PredictIt unreachable
+    """
+    import asyncio
+    import main
+
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    for module in ('discord_bot', 'yfinance'):
+        code = 'import time; start = time.perf_counter(); import ' + module + '; print(time.perf_counter() - start)'
+        run = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=directory, env=env, capture_output=True,
+                             text=True)
+        result = str(round(float(run.stdout.split()[-1]) * 1000)) + ' ms' if run.returncode == 0 else 'unavailable'
+        print('startup: import ' + module + ' ' + result)
+    cache_path = os.path.join(directory, 'marketdata.json')
+    with open(cache_path, 'w') as f:
+        json.dump(synthetic_marketdata(markets), f)
+    loop = asyncio.get_event_loop()
+    for label, path in (('without cache', None), ('with cache', cache_path)):
+        api = main.Api('http://127.0.0.1:9/api/', alert_path=None, history_path=None, cache_path=path)
+        start = time.perf_counter()
+        loop.run_until_complete(api.start())
+        print('startup: Api.start ' + label + ' ' + str(round((time.perf_counter() - start) * 1000)) + ' ms, '
+              + ('snapshot ready' if api.store is not None else 'snapshot loading in the background'))
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+        loop.run_until_complete(api.http.close())
+
+
+BENCHMARKS = {'dispatch': bench_dispatch, 'columns': bench_columns, 'parse': bench_parse, 'history': bench_history,
+              'backtest': bench_backtest, 'rcp': bench_rcp, 'startup': bench_startup}
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--parse-child']:
+        parse_child(*sys.argv[2:])
+        sys.exit()
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+import aiohttp
+
+PREDICTIT_URL = 'https://www.predictit.org/api/'
+RETRY_STATUSES = (502, 503, 504)
+
+
+class Response:
+    """
+    Body and metadata of a finished request, readable after the connection is released
+    """
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def text(self):
+        return self.body.decode('utf-8')
+
+
+class HttpClient:
+    """
+    Pooled keep-alive aiohttp session with timeouts and bounded retries
+    """
+
+    def __init__(self, base_url='', timeout=10, retries=2, backoff=0.5, limit=20):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self.session = None
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def request(self, method, path, **kwargs):
+        """
+        Send a request, retrying connection errors, timeouts and gateway errors
+        :param method: http method
+        :param path: url relative to base_url, or an absolute url
+        :return: Response
+        """
+        url = path if path.startswith('http') else self.base_url + path
+        attempt = 0
+        while True:
+            try:
+                async with self.get_session().request(method, url, **kwargs) as response:
+                    body = await response.read()
+                    result = Response(response.status, response.headers, body)
+                if result.status not in RETRY_STATUSES or attempt >= self.retries:
+                    return result
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+            attempt += 1
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class TtlCache:
+    """
+    Size bounded LRU cache whose entries expire after ttl seconds.
+    Concurrent lookups of a missing key share a single fetch.
+    """
+
+    def __init__(self, ttl=5, maxsize=512):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, fetch):
+        """
+        Return the cached value for key, or await fetch() to fill it
+        :param key: hashable cache key, e.g. (endpoint, id)
+        :param fetch: coroutine function producing the value
+        :return: cached or freshly fetched value
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+        task = self.pending.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self.pending[key] = task
+            task.add_done_callback(lambda done: self.store(key, done))
+        return await asyncio.shield(task)
+
+    def store(self, key, task):
+        self.pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.put(key, task.result())
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+class TokenManager:
+    """
+    Bearer token that is renewed margin seconds before it expires.
+    Concurrent callers that need a new token wait on one shared login.
+    """
+
+    def __init__(self, login, margin=60, retries=3, backoff=1):
+        """
+        :param login: coroutine function returning (token, lifetime in seconds)
+        :param margin: seconds before expiry to renew the token
+        :param retries: logins retried after the first one fails
+        :param backoff: seconds before the first retry, doubled for each one after
+        """
+        self.login = login
+        self.margin = margin
+        self.retries = retries
+        self.backoff = backoff
+        self.token = None
+        self.expires = 0
+        self.pending = None
+        self.timer = None
+
+    async def get(self):
+        """
+        :return: a token that is not about to expire, logging in when there is none
+        """
+        if self.token is not None and time.monotonic() < self.expires - self.margin:
+            return self.token
+        return await self.refresh()
+
+    async def refresh(self, rejected=None):
+        """
+        Log in again, or join the login already in flight
+        :param rejected: token the server just refused, so a caller that lost the race reuses the newer one
+        :return: new token
+        """
+        if rejected is not None and self.token is not None and self.token != rejected:
+            return self.token
+        if self.pending is None:
+            self.pending = asyncio.ensure_future(self.renew())
+        return await asyncio.shield(self.pending)
+
+    async def renew(self):
+        try:
+            attempt = 0
+            while True:
+                try:
+                    token, lifetime = await self.login()
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError):
+                    if attempt >= self.retries:
+                        raise
+                attempt += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            self.token = token
+            self.expires = time.monotonic() + lifetime
+            self.schedule(lifetime)
+            return token
+        finally:
+            self.pending = None
+
+    def schedule(self, lifetime):
+        """
+        Renew in the background ahead of expiry, so requests never wait on a login
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+        delay = max(lifetime - self.margin, 1)
+        self.timer = asyncio.get_event_loop().call_later(delay, lambda: asyncio.ensure_future(self.renew_quietly()))
+
+    async def renew_quietly(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print('token refresh failed: ' + repr(e))
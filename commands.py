@@ -0,0 +1,109 @@
+import asyncio
+
+
+class Command:
+    def __init__(self, name, handler, parser, stat, ready=None):
+        self.name = name
+        self.handler = handler
+        self.parser = parser
+        self.stat = stat
+        self.ready = ready
+
+
+def text(words):
+    """
+    Whole argument as one string
+    """
+    return ' '.join(words),
+
+
+def no_arguments(words):
+    return ()
+
+
+def trailing_int(default):
+    """
+    Build a parser splitting an optional trailing number off the argument
+    :param default: value used when the last word is not a number
+    :return: parser returning (text, number, whether the number was given)
+    """
+    def parse(words):
+        if len(words) > 1:
+            try:
+                return ' '.join(words[:-1]), int(words[-1]), True
+            except ValueError:
+                pass
+        return ' '.join(words), default, False
+    return parse
+
+
+def ints(count):
+    """
+    Build a parser taking the last count words as numbers
+    :return: parser returning (list of numbers, list of unused leading words)
+    """
+    def parse(words):
+        try:
+            if len(words) < count:
+                raise ValueError
+            return [int(word) for word in words[len(words) - count:]], words[:len(words) - count]
+        except ValueError:
+            raise ValueError('Expected ' + str(count) + ' numbers')
+    return parse
+
+
+class Router:
+    """
+    Maps the first word of a message, prefix included, to a command with one dict lookup
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.stats = {'users': {}, 'commands': {}}
+
+    def command(self, *aliases, parser=no_arguments, stat=None, ready=None):
+        """
+        Register a handler under every alias, e.g. @router.command(',risk', ',r', parser=text)
+        :param ready: coroutine function awaited before the handler, e.g. to wait for data the command reads
+        """
+        def register(handler):
+            command = Command(aliases[0], handler, parser, stat, ready)
+            for alias in aliases:
+                self.commands[alias.lower()] = command
+            return handler
+        return register
+
+    def parse(self, content):
+        """
+        Tokenize a message and find its command
+        :param content: message text
+        :return: (command, parsed arguments), or None if the message is not a command
+        :raises ValueError: when the arguments do not fit the command
+        """
+        words = content.split()
+        if not words:
+            return None
+        command = self.commands.get(words[0].lower())
+        if command is None:
+            return None
+        return command, command.parser(words[1:])
+
+    async def dispatch(self, message):
+        try:
+            parsed = self.parse(message.content)
+        except ValueError as e:
+            await message.channel.send(str(e))
+            return True
+        if parsed is None:
+            return False
+        command, args = parsed
+        if command.stat:
+            self.stats['commands'][command.stat] = self.stats['commands'].get(command.stat, 0) + 1
+            self.stats['users'][message.author] = self.stats['users'].get(message.author, 0) + 1
+        if command.ready is not None:
+            await command.ready()
+        try:
+            await command.handler(message, *args)
+        except asyncio.TimeoutError:
+            await message.channel.send(command.name + ' took too long and was cancelled')
+        return True
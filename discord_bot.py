@@ -1,327 +1,287 @@
 import asyncio
+import os
 import main
-import auths
 import discord
-import requests
-import json
-import yfinance as yf
+from client import HttpClient
+from commands import Router, text, trailing_int, ints
+from rcp import RcpService
+from results import Feed, ResultsPoller
 
-api = main.Api()
-client = discord.Client()
-stats = {'users': {}, 'commands': {}}
+HUB = os.environ.get('MARKETDATA_HUB')
+FEEDS = [
+    Feed('nh', 'NH', 'https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json',
+         ['Klobuchar', 'Sanders', 'Warren', 'Yang', 'Steyer', 'Biden', 'Buttigieg'], channel=671281289105768449),
+]
+router = Router()
+stats = router.stats
+# Built under __main__: the analytics workers import this module again and must not open the journal or a client
+api = None
+http = None
+polls = None
+results = None
+client = None
 
 
-@client.event
 async def on_message(message):
     if message.author == client.user:
-        pass
-    elif message.content.startswith(",Hello") or message.content.startswith(",hello"):
-        await message.channel.send('Hello')
-    elif message.content.startswith(",Bye") or message.content.startswith(",bye"):
-        await message.channel.send('Bye')
-    elif message.content.startswith(",murder") or message.content.startswith(",kill"):
-        msg = "oh no you have killed me\n"
-        msg += "I am ded"
-        await message.channel.send(msg)
-    elif message.content.startswith(",vote") or message.content.startswith(",hack") or message.content.startswith(
-            ",rig"):
-        await message.channel.send("Can't do that unfortunately, I'm not Russian")
-    elif message.content.startswith("!burn") or message.content.startswith(",burn"):
-        await message.channel.send("No U")
-    elif message.content.startswith(",tip") or message.content.startswith(",donate"):
-        msg = "This bot took a while to make, and as a broke college student, I'd really appreciate a donation if you make any money off predictit...\n"
-        msg += "    Bitcoin: \n    bc1qxmm7l2vhema687hrvle3yyp04h6svzy8tkk8sg\n"
-        msg += "    PayPay, Venmo, etc: \n    PM @crazycrabman#2555\n"
-        await message.channel.send(msg)
-    elif message.content.startswith(",Risk") or message.content.startswith(",risk") or message.content.startswith(
-            ",r "):
-        stats['commands']['risk'] = stats['commands'].get('risk', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        if len(argument) > 2:
-            try:
-                shares = int(argument[-1])
-                market = argument[1:-1]
-                minimum = True
-            except:
-                market = argument[1:]
-                shares = 850
-                minimum = False
-        else:
-            shares = 850
-            minimum = False
-            market = argument[1:]
-        whole = ""
-        for part in market:
-            whole += part + " "
-        market = whole[:-1]
-        print("Risk")
-        print(market, shares, message.author)
-        if market == 'top' or market == 'all':
-            title, info = api.optimize_all(max_shares=shares)
+        return
+    await router.dispatch(message)
+
+
+async def market_data():
+    await api.wait_loaded()
+
+
+@router.command(',hello')
+async def hello(message):
+    await message.channel.send('Hello')
+
+
+@router.command(',bye')
+async def bye(message):
+    await message.channel.send('Bye')
+
+
+@router.command(',murder', ',kill')
+async def murder(message):
+    msg = "oh no you have killed me\n"
+    msg += "I am ded"
+    await message.channel.send(msg)
+
+
+@router.command(',vote', ',hack', ',rig')
+async def vote(message):
+    await message.channel.send("Can't do that unfortunately, I'm not Russian")
+
+
+@router.command('!burn', ',burn')
+async def burn(message):
+    await message.channel.send("No U")
+
+
+@router.command(',tip', ',donate')
+async def tip(message):
+    msg = "This bot took a while to make, and as a broke college student, I'd really appreciate a donation if you make any money off predictit...\n"
+    msg += "    Bitcoin: \n    bc1qxmm7l2vhema687hrvle3yyp04h6svzy8tkk8sg\n"
+    msg += "    PayPay, Venmo, etc: \n    PM @crazycrabman#2555\n"
+    await message.channel.send(msg)
+
+
+@router.command(',risk', ',r', parser=trailing_int(850), stat='risk', ready=market_data)
+async def risk(message, market, shares, minimum):
+    print("Risk")
+    print(market, shares, message.author)
+    if (market == 'top' or market == 'all') and shares == 850 and api.opportunities is not None:
+        title, info = api.format_findings(api.ranked_opportunities(), ranked=True)
+        embed = discord.Embed(title=title, description=info, color=2206669)
+        await message.channel.send(embed=embed)
+    elif market == 'top' or market == 'all':
+        found = []
+        sent = None
+        async for findings in api.scan_all(max_shares=shares):
+            if not findings and sent is not None:
+                continue
+            found += findings
+            title, info = api.format_findings(found, done=False)
             embed = discord.Embed(title=title, description=info, color=2206669)
-            await message.channel.send(embed=embed)
-        else:
-            title, info, url = api.get_market_risk(market, shares, minimum)
-            embed = discord.Embed(title=title, url=url,
-                                  description=info, color=2206669)
-            await message.channel.send(embed=embed)
-    elif message.content.startswith(",Bins") or message.content.startswith(",bins") or message.content.startswith(
-            ",b "):
-        stats['commands']['bins'] = stats['commands'].get('bins', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        market = argument[1:]
-        whole = ""
-        for part in market:
-            whole += part + " "
-        market = whole.strip()
-        title, bins, url = api.get_market_bins(market)
+            if sent is None:
+                sent = await message.channel.send(embed=embed)
+            else:
+                await sent.edit(embed=embed)
+        title, info = api.format_findings(found)
+        embed = discord.Embed(title=title, description=info, color=2206669)
+        await sent.edit(embed=embed)
+    else:
+        title, info, url = await api.get_market_risk(market, shares, minimum)
         embed = discord.Embed(title=title, url=url,
-                              description=bins, color=2206669)
-        print("Bins")
-        print(market, message.author)
+                              description=info, color=2206669)
         await message.channel.send(embed=embed)
-    elif message.content.startswith(",v ") or message.content.startswith(",value") or message.content.startswith(
-            ",Value"):
-        stats['commands']['rcp'] = stats['commands'].get('rcp', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        if len(argument) > 2:
+
+
+@router.command(',bins', ',b', parser=text, stat='bins', ready=market_data)
+async def bins(message, market):
+    title, bins, url = api.get_market_bins(market)
+    embed = discord.Embed(title=title, url=url,
+                          description=bins, color=2206669)
+    print("Bins")
+    print(market, message.author)
+    await message.channel.send(embed=embed)
+
+
+@router.command(',value', ',v', parser=trailing_int(0), stat='value', ready=market_data)
+async def value(message, market, bin, given):
+    msg = await api.value_buy(market, bin - 1)
+    print("Value")
+    print(market, bin, message.author)
+    await message.channel.send(msg)
+
+
+@router.command(',.', parser=text, stat='search_bins', ready=market_data)
+async def search_bins(message, keyword):
+    msg = api.get_related_market_bins(keyword)
+    print("Similar")
+    print(keyword, message.author)
+    await message.channel.send(msg)
+
+
+@router.command(',-', parser=text, stat='search_titles', ready=market_data)
+async def search_titles(message, keyword):
+    msg = api.get_related_markets(keyword)
+    print("Similar")
+    print(keyword, message.author)
+    await message.channel.send(msg)
+
+
+@router.command(',history', ',y', parser=trailing_int(24), stat='history', ready=market_data)
+async def history(message, market, hours, given):
+    title, info, url = await api.get_market_history(market, hours)
+    embed = discord.Embed(title=title, url=url,
+                          description=info, color=2206669)
+    print("History")
+    print(market, hours, message.author)
+    await message.channel.send(embed=embed)
+
+
+@router.command(',o', parser=text, stat='orderbook', ready=market_data)
+async def orderbook(message, keyword):
+    title, msg, url = await api.discord_orderbook(keyword)
+    embed = discord.Embed(title=title, url=url,
+                          description=msg, color=2206669)
+    print("Offers")
+    print(keyword, message.author)
+    await message.channel.send(embed=embed)
+
+
+@router.command(',rcp', ',p', parser=text, stat='rcp')
+async def rcp(message, keyword):
+    found = await polls.latest(keyword)
+    if found is None:
+        await message.channel.send('No RCP average for "' + keyword + '", try one of: ' + polls.names())
+        return
+    title, averages = found
+    max_len = max([len(name) for name, average in averages] + [4])
+    msg = "```Name" + '  ' + (' ' * (max_len - 4)) + "Average\n"
+    for name, average in averages:
+        msg += name + '  ' + (' ' * (max_len - len(name))) + str(average) + '\n'
+    msg += '```'
+    print("RCP")
+    print(keyword, message.author)
+    embed = discord.Embed(title=title, description=msg, color=2206669)
+    await message.channel.send(embed=embed)
+
+
+@router.command(',alert', ',a', parser=ints(3), stat='alert')
+async def alert(message, numbers, rest):
+    market, bin, value = numbers
+    bin -= 1
+    if len(rest) > 0:
+        await message.channel.send('Expected 3 arguments')
+    print(message.author)
+    user = '<@' + str(message.author.id) + '>'
+    api.log_alert(user, market, bin, value)
+    msg = "Setting alert for market " + str(market) + "\n"
+    if value > 0:
+        msg += "This alert will trigger when B" + str(bin + 1) + " goes above " + str(value) + '¢'
+    else:
+        msg += "This alert will trigger when B" + str(bin + 1) + " goes below " + str(-value) + '¢'
+    await message.channel.send(msg)
+
+
+@router.command(',stock', ',s', parser=text, stat='stocks')
+async def stock(message, market):
+    try:
+        price = await asyncio.get_event_loop().run_in_executor(None, stock_price, market)
+        await message.channel.send(market + " is currently trading at $" + str(price))
+    except IndexError:
+        await message.channel.send(market + " not found")
+
+
+def stock_price(market):
+    """
+    Blocking yfinance lookup, run in an executor
+    """
+    import yfinance as yf
+
+    return yf.Ticker(market).info['regularMarketPrice']
+
+
+@router.command(',help', ',h', stat='help')
+async def show_help(message):
+    title = "Here are the commands I can perform:\n"
+    msg = ",help or ,h brings up this message.\n"
+    msg += ",risk or ,r figures out whether a market has negative risk or not. The keyword 'all' searches all the markets.\n"
+    msg += ",bins or ,b shows the prices for each bin in a market.\n"
+    msg += ",value or ,v compares the cost of buying Yes and buying no on everything else.\n"
+    msg += ",- gets all the markets that contain the input in the title.\n"
+    msg += ",. gets all the markets that contain the input in the one of the bins.\n"
+    msg += ",history or ,y shows how each bin moved over the last day, or over the hours given after the market.\n"
+    msg += ",o gets the volume of the contracts in a specific market.\n"
+    msg += ",rcp or ,p gets the current rcp averages for the nation or individual states.\n"
+    msg += ",stock or ,s gets the last traded price of the indicated ticker. \n"
+    msg += ",i or ,implied gets the implied odds of each candidate winning the presidency (% pres / % nom). \n"
+    msg += "\n"
+    msg += "This bot took a while to make, and as a broke college student, I'd really appreciate a donation if like the bot or find it useful.\n"
+    msg += "    Bitcoin: \n    bc1qxmm7l2vhema687hrvle3yyp04h6svzy8tkk8sg\n"
+    msg += "    PayPay, Venmo, etc: \n    PM @crazycrabman#2555\n"
+    msg += "The bot is running on AWS, so it should be online 24/7. If it isn't, you have an idea for another command, or just want to chat about this bot, PM @crazycrabman#2555\n"
+    print("Help")
+    print(message.author)
+    embed = discord.Embed(title=title, description=msg, color=2206669)
+    await message.channel.send(embed=embed)
+
+
+@router.command(',implied', ',i', stat='implied', ready=market_data)
+async def implied(message):
+    msg = await api.divide_bins(3698, 3633)
+    embed = discord.Embed(title="Implied dem presidential victory odds", description=msg, color=2206669)
+    await message.channel.send(embed=embed)
+
+
+@router.command(',stats')
+async def show_stats(message):
+    msg = ""
+    for user, num in stats['users'].items():
+        msg += user.name + ": " + str(num) + '\n'
+    embed = discord.Embed(title="user stats", description=msg, color=2206669)
+    await message.channel.send(embed=embed)
+    msg = ""
+    for command, num in stats['commands'].items():
+        msg += command + ": " + str(num) + '\n'
+    embed = discord.Embed(title="command stats", description=msg, color=2206669)
+    await message.channel.send(embed=embed)
+    msg = ""
+    for name, num in api.cache.stats().items():
+        msg += name + ": " + str(num) + '\n'
+    embed = discord.Embed(title="cache stats", description=msg, color=2206669)
+    await message.channel.send(embed=embed)
+
+
+def results_command(feed):
+    async def show_results(message, place):
+        if feed.race is None:
             try:
-                bin = int(argument[-1])
-                market = argument[1:-1]
-            except:
-                market = argument[1:]
-                bin = 0
+                await results.fetch(feed)
+            except Exception as e:
+                print(feed.name + ' results fetch failed: ' + repr(e))
+        if feed.race is None:
+            await message.channel.send(feed.title + " results unavailable")
+            return
+        if not place:
+            title, msg = feed.title + " Results", feed.summary()
         else:
-            bin = 0
-            market = argument[1:]
-        whole = ""
-        for part in market:
-            whole += part + " "
-        market = whole.strip()
-        msg = api.value_buy(market, bin - 1)
-        print("Value")
-        print(market, bin, message.author)
-        await message.channel.send(msg)
-    elif message.content.startswith(",. "):
-        stats['commands']['search_bins'] = stats['commands'].get('search_bins', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        keyword = argument[1:]
-        whole = ""
-        for part in keyword:
-            whole += part + " "
-        keyword = whole.strip()
-        msg = api.get_related_market_bins(keyword)
-        print("Similar")
-        print(keyword, message.author)
-        await message.channel.send(msg)
-    elif message.content.startswith(",- "):
-        stats['commands']['search_titles'] = stats['commands'].get('search_titles', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        keyword = argument[1:]
-        whole = ""
-        for part in keyword:
-            whole += part + " "
-        keyword = whole.strip()
-        msg = api.get_related_markets(keyword)
-        print("Similar")
-        print(keyword, message.author)
-        await message.channel.send(msg)
-    elif message.content.startswith(",o "):
-        stats['commands']['orderbook'] = stats['commands'].get('orderbook', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        keyword = argument[1:]
-        whole = ""
-        for part in keyword:
-            whole += part + " "
-        keyword = whole.strip()
-        title, msg, url = api.discord_orderbook(keyword)
-        embed = discord.Embed(title=title, url=url,
-                              description=msg, color=2206669)
-        print("Offers")
-        print(keyword, message.author)
-        await message.channel.send(embed=embed)
-    elif message.content.startswith(",rcp") or message.content.startswith(",RCP") or message.content.startswith(",p"):
-        stats['commands']['rcp'] = stats['commands'].get('rcp', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        keyword = argument[1:]
-        whole = ""
-        for part in keyword:
-            whole += part + " "
-        keyword = whole.strip()
-        if keyword.lower() == 'iowa' or keyword.lower() == 'ia':
-            title = "RCP average for Iowa"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6731_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'nv' or keyword.lower() == 'nevada':
-            title = "RCP average for Nevada"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6866_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'nh' or keyword.lower() == 'new hampshire':
-            title = "RCP average for New Hampshire"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6276_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'sc' or keyword.lower() == 'south carolina':
-            title = "RCP average for South Carolina"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6824_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'national' or keyword.lower() == 'nation':
-            title = "RCP average for the nation"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6730_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'california' or keyword.lower() == 'ca':
-            title = "RCP average for California"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6879_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'texas' or keyword.lower() == 'tx':
-            title = "RCP average for Texas"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6875_historical.js").text[12:][:-2]
-        elif keyword.lower() == 'massachusetts' or keyword.lower() == 'ma':
-            title = "RCP average for Massachusetts"
-            averages = requests.get("https://www.realclearpolitics.com/epolls/json/6786_historical.js").text[12:][:-2]
-        averages = json.loads(averages)
-        max_len = 0
-        for candidate in averages['poll']['rcp_avg'][0]['candidate']:
-            if len(candidate['name']) > max_len and candidate['value']:
-                max_len = len(candidate['name'])
-        msg = "```Name" + '  ' + (' ' * (max_len - 4)) + "Average\n"
-        for candidate in averages['poll']['rcp_avg'][0]['candidate']:
-            if candidate['value']:
-                msg += candidate['name'] + '  ' + (' ' * (max_len - len(candidate['name']))) + str(
-                    candidate['value']) + '\n'
-        msg += '```'
-        print("RCP")
-        print(keyword, message.author)
-        embed = discord.Embed(title=title, description=msg, color=2206669)
-        await message.channel.send(embed=embed)
-    elif message.content.startswith(",alert") or message.content.startswith(",a"):
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        keywords = argument[1:]
-        value = int(keywords.pop(-1))
-        bin = int(keywords.pop(-1)) - 1
-        market = int(keywords.pop(-1))
-        if len(keywords) > 0:
-            await message.channel.send('Expected 3 arguments')
-        print(message.author)
-        user = '<@' + str(message.author.id) + '>'
-        api.log_alert(user, market, bin, value)
-        msg = "Setting alert for market " + str(market) + "\n"
-        if value > 0:
-            msg += "This alert will trigger when B" + str(bin + 1) + " goes above " + str(value) + '¢'
-        else:
-            msg += "This alert will trigger when B" + str(bin + 1) + " goes below " + str(-value) + '¢'
-        await message.channel.send(msg)
-    elif message.content.startswith(",stock") or message.content.startswith(",s "):
-        stats['commands']['stocks'] = stats['commands'].get('stocks', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        argument = message.content.split(' ')
-        market = argument[1:]
-        whole = ""
-        for part in market:
-            whole += part + " "
-        market = whole.strip()
-        data = yf.Ticker(market)
-        try:
-            await message.channel.send(market + " is currently trading at $" + str(data.info['regularMarketPrice']))
-        except IndexError:
-            await message.channel.send(market + " not found")
-    elif message.content.startswith(",Help") or message.content.startswith(",help") or message.content.startswith(",h"):
-        stats['commands']['help'] = stats['commands'].get('help', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        title = "Here are the commands I can perform:\n"
-        msg = ",help or ,h brings up this message.\n"
-        msg += ",risk or ,r figures out whether a market has negative risk or not. The keyword 'all' searches all the markets.\n"
-        msg += ",bins or ,b shows the prices for each bin in a market.\n"
-        msg += ",value or ,v compares the cost of buying Yes and buying no on everything else.\n"
-        msg += ",- gets all the markets that contain the input in the title.\n"
-        msg += ",. gets all the markets that contain the input in the one of the bins.\n"
-        msg += ",o gets the volume of the contracts in a specific market.\n"
-        msg += ",rcp or ,p gets the current rcp averages for the nation or individual states.\n"
-        msg += ",stock or ,s gets the last traded price of the indicated ticker. \n"
-        msg += ",i or ,implied gets the implied odds of each candidate winning the presidency (% pres / % nom). \n"
-        msg += "\n"
-        msg += "This bot took a while to make, and as a broke college student, I'd really appreciate a donation if like the bot or find it useful.\n"
-        msg += "    Bitcoin: \n    bc1qxmm7l2vhema687hrvle3yyp04h6svzy8tkk8sg\n"
-        msg += "    PayPay, Venmo, etc: \n    PM @crazycrabman#2555\n"
-        msg += "The bot is running on AWS, so it should be online 24/7. If it isn't, you have an idea for another command, or just want to chat about this bot, PM @crazycrabman#2555\n"
-        print("Help")
-        print(message.author)
-        embed = discord.Embed(title=title, description=msg, color=2206669)
-        await message.channel.send(embed=embed)
-    elif message.content.startswith(",i") or message.content.startswith(",implied"):
-        stats['commands']['implied'] = stats['commands'].get('implied', 0) + 1
-        stats['users'][message.author] = stats['users'].get(message.author, 0) + 1
-        msg = api.divide_bins(3698, 3633)
-        embed = discord.Embed(title="Implied dem presidential victory odds", description=msg, color=2206669)
+            title, msg = feed.title + " results for " + place, feed.place(place)
+            if msg is None:
+                await message.channel.send(place + " not found")
+                return
+        embed = discord.Embed(title=title, description=msg, color=2206669, url=feed.url)
         await message.channel.send(embed=embed)
-    elif message.content.startswith(",stats"):
-        msg = ""
-        for user, num in stats['users'].items():
-            msg += user.name + ": " + str(num) + '\n'
-        embed = discord.Embed(title="user stats", description=msg, color=2206669)
-        await message.channel.send(embed=embed)
-        msg = ""
-        for command, num in stats['commands'].items():
-            msg += command + ": " + str(num) + '\n'
-        embed = discord.Embed(title="command stats", description=msg, color=2206669)
-        await message.channel.send(embed=embed)
-    elif message.content.startswith(",nh"):
-        argument = message.content.split(' ')
-        try:
-            county = argument[1:]
-            whole = ""
-            for part in county:
-                whole += part + " "
-            county = whole.strip()
-        except KeyError:
-            county = None
-        old = {'Klobuchar': 0, 'Sanders': 0, 'Warren': 0, 'Yang': 0, 'Steyer': 0, 'Biden': 0, 'Buttigieg': 0}
-        results = requests.get(
-            "https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json").json()
-        if not county:
-            candidate_results = results['data']['races'][0]['candidates']
-            msg = "```"
-            for candidate in candidate_results:
-                if candidate['last_name'] in old.keys():
-                    msg += candidate['last_name'] + "  " + ' ' * (9-len(candidate['last_name'])) + str(candidate['votes']) + ' ' * (5-len(str(candidate['votes']))) + "  " + candidate['percent_display'] + "%\n"
-            msg += str(results['data']['races'][0]['precincts_reporting']) + "/" + str(results['data']['races'][0]['precincts_total']) + " reporting\n"
-            msg += "```"
-            title = "NH Results"
-            embed = discord.Embed(title=title, description=msg, color=2206669,
-                                  url="https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json")
-            await message.channel.send(embed=embed)
-        else:
-            county_results = results['data']['races'][0]['counties']
-            for place in county_results:
-                if place['name'].lower() == county.lower():
-                    title = "NH results for " + place['name']
-                    msg = "```"
-                    for name, num in place['results'].items():
-                        for key in old.keys():
-                            if key.lower() in name:
-                                msg += key + "  " + ' ' * (9-len(key)) + str(num) + '\n'
-                    msg += str(place['reporting']) + "/" + str(place['precincts']) + " reporting\n"
-                    msg += "```"
-                    embed = discord.Embed(title=title, description=msg, color=2206669,
-                                          url="https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json")
-                    await message.channel.send(embed=embed)
-                    return
-            town_results = results['data']['races'][0]['townships']
-            for place in town_results:
-                if place['name'].lower() == county.lower():
-                    title = "NH results for " + place['name']
-                    msg = "```"
-                    for name, num in place['results'].items():
-                        for key in old.keys():
-                            if key.lower() in name:
-                                msg += key + "  " + ' ' * (9 - len(key)) + str(num) + '\n'
-                    msg += "```"
-                    embed = discord.Embed(title=title, description=msg, color=2206669,
-                                          url="https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json")
-                    await message.channel.send(embed=embed)
-
-@client.event
+    return show_results
+
+
+for feed in FEEDS:
+    router.command(',' + feed.name, parser=text)(results_command(feed))
+
+
 async def on_ready():
     print('Logged in as')
     print(client.user.name)
@@ -332,58 +292,75 @@ async def on_ready():
 async def my_background_task():
     await client.wait_until_ready()
     print('starting')
-    while client.is_ready():
-        messages = api.get_messages()
-        for i, message in enumerate(messages):
-            if message:
-                await client.get_channel(671281289105768449).send(message)
-                messages[i] = None
-        api.messages = [message for message in messages if message is not None]
-        await asyncio.sleep(30)
+    channel = client.get_channel(671281289105768449)
+    while not client.is_closed():
+        batch = await api.next_messages()
+        for content, ids in chunk_messages(batch):
+            try:
+                await channel.send(content)
+            except discord.HTTPException as e:
+                print('alert delivery failed', e)
+                for id in ids:
+                    api.message_failed(id)
+            else:
+                for id in ids:
+                    api.message_sent(id)
+            await asyncio.sleep(1)
+
 
+def chunk_messages(batch, limit=2000):
+    """
+    Pack notifications into as few channel messages as fit Discord's length limit.
+    A notification too long to fit on its own is cut short, so it can still be delivered.
+    :param batch: list of (id, message) pairs
+    :return: list of (content, ids of the notifications in it)
+    """
+    chunks = []
+    content, ids = '', []
+    for id, message in batch:
+        if len(message) + 2 > limit:
+            message = message[:limit - 5] + '...'
+        if ids and len(content) + len(message) + 2 > limit:
+            chunks.append((content, ids))
+            content, ids = '', []
+        content += message + '\n\n'
+        ids.append(id)
+    if ids:
+        chunks.append((content, ids))
+    return chunks
 
-async def poll_check():
+
+async def post_results(feed, candidates, places):
+    msg = feed.summary(candidates) if candidates else ''
+    if places:
+        msg += "Updated: " + ', '.join(places[:10]) + (' and ' + str(len(places) - 10) + ' more' if len(places) > 10 else '')
+    print(feed.title + " Update")
+    embed = discord.Embed(title=feed.title + " Results Changed", description=msg, color=2206669, url=feed.url)
+    await client.get_channel(feed.channel).send(embed=embed)
+
+
+
+async def poll_results():
     await client.wait_until_ready()
-    old = {'Klobuchar': 0, 'Sanders': 0, 'Warren': 0, 'Yang': 0, 'Steyer': 0, 'Biden': 0, 'Buttigieg': 0}
-    results = requests.get(
-        "https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json").json()
-    candidate_results = results['data']['races'][0]['candidates']
-    for candidate in candidate_results:
-        try:
-            old[candidate['last_name']] += candidate['votes']
-        except KeyError:
-            pass
-    print(old)
-    while client.is_ready():
-        changed = False
-        results = requests.get(
-            "https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json").json()
-        candidate_results = results['data']['races'][0]['candidates']
-        for candidate in candidate_results:
-            try:
-                if candidate['votes'] != old[candidate['last_name']]:
-                    changed = True
-                    old[candidate['last_name']] = candidate['votes']
-            except KeyError:
-                pass
-        print(old)
-        if changed:
-            title = "NH Results Changed"
-            msg = "```"
-            for candidate in candidate_results:
-                if candidate['last_name'] in old.keys():
-                    msg += candidate['last_name'] + "  " + ' ' * (9 - len(candidate['last_name'])) + str(
-                        candidate['votes']) + ' ' * (5 - len(str(candidate['votes']))) + "  " + candidate[
-                               'percent_display'] + "%\n"
-            msg += str(results['data']['races'][0]['precincts_reporting']) + "/" + str(results['data']['races'][0]['precincts_total']) + " reporting\n"
-            msg += "```"
-            print("NH Update")
-            embed = discord.Embed(title=title, description=msg, color=2206669,
-                                  url="https://int.nyt.com/applications/elections/2020/data/api/2020-02-11/new-hampshire/president/democrat.json")
-            await client.get_channel(671281289105768449).send(embed=embed)
-        await asyncio.sleep(5)
-
-
-client.loop.create_task(my_background_task())
-client.loop.create_task(poll_check())
-client.run(auths.discord_token)
+    await results.run()
+
+
+if __name__ == '__main__':
+    import auths
+
+    api = main.Api(alert_path=None, cache_path=None) if HUB else main.Api()
+    http = HttpClient()
+    polls = RcpService(http)
+    results = ResultsPoller(http, FEEDS, post_results)
+    client = discord.Client()
+    client.event(on_message)
+    client.event(on_ready)
+    client.loop.run_until_complete(api.follow(HUB) if HUB else api.start())
+    client.loop.create_task(my_background_task())
+    client.loop.create_task(poll_results())
+    client.loop.create_task(polls.run())
+    try:
+        client.run(auths.discord_token)
+    finally:
+        api.save_cache()
+        api.alerts.flush()
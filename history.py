@@ -0,0 +1,124 @@
+import datetime
+import os
+import numpy as np
+
+FRAME = np.dtype([('time', '<i8'), ('end', '<i8')])
+CHANGE = np.dtype([('contract', '<i4'), ('yes', '<i2'), ('no', '<i2'), ('last', '<i2')])
+MISSING = -1
+
+
+def cents(prices):
+    return np.where(np.isnan(prices), MISSING, np.rint(prices * 100)).astype('<i2')
+
+
+def prices(cents):
+    return np.where(cents == MISSING, np.nan, cents / 100)
+
+
+def utc_date(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).date()
+
+
+class History:
+    """
+    Contract prices of every snapshot, stored per UTC day as two append-only files:
+    DAY.changes holds (contract, yes, no, last) rows in cents for the contracts that moved since the previous
+    snapshot, and DAY.frames holds (time, end) so frame i owns the rows between end[i - 1] and end[i].
+    The first frame of each day, and the first one after a restart, holds every contract so days can be read alone.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.day = None
+        self.written = 0
+        self.ids = None
+        self.values = None
+        os.makedirs(path, exist_ok=True)
+
+    def day_path(self, name, extension):
+        return os.path.join(self.path, name + '.' + extension)
+
+    def record(self, columns, timestamp):
+        """
+        Append the prices of a snapshot
+        :param columns: store.Columns of the snapshot
+        :param timestamp: unix time of the snapshot
+        :return: number of rows written
+        """
+        order = np.argsort(columns.contract_ids, kind='stable')
+        ids = columns.contract_ids[order].astype('<i4')
+        values = np.stack([cents(columns.yes[order]), cents(columns.no[order]), cents(columns.last[order])], axis=1)
+        name = utc_date(timestamp).isoformat()
+        if name != self.day:
+            self.day = name
+            self.ids = None
+            frames_path = self.day_path(name, 'frames')
+            changes_path = self.day_path(name, 'changes')
+            frames = self.read(frames_path, FRAME)
+            self.written = int(frames['end'][-1]) if len(frames) else 0
+            for path, size in ((frames_path, len(frames) * FRAME.itemsize), (changes_path, self.written * CHANGE.itemsize)):
+                if os.path.exists(path):
+                    os.truncate(path, size)
+        moved = np.ones(len(ids), dtype=bool)
+        if self.ids is not None and len(self.ids):
+            found = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+            moved = (self.ids[found] != ids) | (self.values[found] != values).any(axis=1)
+        rows = np.empty(int(moved.sum()), dtype=CHANGE)
+        rows['contract'] = ids[moved]
+        rows['yes'], rows['no'], rows['last'] = values[moved].T
+        with open(self.day_path(name, 'changes'), 'ab') as f:
+            f.write(rows.tobytes())
+        self.written += len(rows)
+        with open(self.day_path(name, 'frames'), 'ab') as f:
+            f.write(np.array([(int(timestamp), self.written)], dtype=FRAME).tobytes())
+        self.ids = ids
+        self.values = values
+        return len(rows)
+
+    def read(self, path, dtype):
+        if not os.path.exists(path) or os.path.getsize(path) < dtype.itemsize:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(os.path.getsize(path) // dtype.itemsize,))
+
+    def days(self, start, end):
+        first = utc_date(start)
+        last = utc_date(end)
+        while first <= last:
+            yield first.isoformat()
+            first += datetime.timedelta(days=1)
+
+    def contract_series(self, contract_ids, start, end):
+        """
+        Price changes of some contracts between two times
+        :param contract_ids: contract ids
+        :param start: unix time, the price in effect at start is included
+        :param end: unix time
+        :return: {contract id: (times, yes, no, last)} numpy arrays with nan for missing prices,
+                 one entry per snapshot where the contract moved
+        """
+        wanted = np.array([int(id) for id in contract_ids], dtype='<i4')
+        times = []
+        rows = []
+        for name in self.days(start, end):
+            frames = self.read(self.day_path(name, 'frames'), FRAME)
+            if not len(frames):
+                continue
+            changes = self.read(self.day_path(name, 'changes'), CHANGE)[:frames['end'][-1]]
+            positions = np.flatnonzero(np.isin(changes['contract'], wanted))
+            times.append(frames['time'][np.searchsorted(frames['end'], positions, side='right')])
+            rows.append(np.array(changes[positions]))
+        times = np.concatenate(times) if times else np.empty(0, dtype=np.int64)
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=CHANGE)
+        series = {}
+        for id in wanted.tolist():
+            mine = rows['contract'] == id
+            contract_times = times[mine]
+            first = max(np.searchsorted(contract_times, start, side='right') - 1, 0)
+            last = np.searchsorted(contract_times, end, side='right')
+            contract_rows = rows[mine][first:last]
+            series[id] = (contract_times[first:last], prices(contract_rows['yes']), prices(contract_rows['no']),
+                          prices(contract_rows['last']))
+        return series
+
+    def size(self):
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import struct
+import sys
+
+HUB_PATH = 'marketdata.sock'
+
+
+def frame(message):
+    """
+    Encode a message as a 4 byte big endian length followed by its json
+    """
+    body = json.dumps(message).encode('utf-8')
+    return struct.pack('>I', len(body)) + body
+
+
+async def receive(reader):
+    """
+    Read one framed message
+    :raises asyncio.IncompleteReadError: when the other side closed the connection
+    """
+    size = struct.unpack('>I', await reader.readexactly(4))[0]
+    return json.loads(await reader.readexactly(size))
+
+
+def diff_message(store, diff):
+    """
+    Markets a follower has to replace or drop to reach store, with the market order when it changed
+    """
+    return {'type': 'diff', 'markets': [store.markets[id] for id in diff.changed], 'removed': diff.removed,
+            'order': list(store.markets) if diff.added or diff.removed else None}
+
+
+class Hub:
+    """
+    Owns the upstream reload, alert checks and negative risk scans for any number of bot processes.
+    Every client gets the current snapshot and negative risk table when it connects and then each diff
+    and each new table, over a unix socket.
+    Clients forward new alerts and delivery receipts; notifications go to the client that asked to deliver them.
+    """
+
+    def __init__(self, api, path=HUB_PATH, max_buffer=64 * 2 ** 20):
+        """
+        :param api: main.Api that is not started yet
+        :param path: unix socket path
+        :param max_buffer: bytes a client may fall behind before it is disconnected
+        """
+        self.api = api
+        self.path = path
+        self.max_buffer = max_buffer
+        self.clients = []
+        self.delivery = None
+        self.in_flight = {}
+        self.server = None
+
+    async def start(self):
+        await self.api.start()
+        await self.api.wait_loaded()
+        self.api.reload_listeners.append(self.publish)
+        self.api.opportunity_listeners.append(self.publish_opportunities)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = await asyncio.start_unix_server(self.serve, self.path)
+        asyncio.ensure_future(self.deliver())
+
+    async def serve(self, reader, writer):
+        writer.write(frame({'type': 'snapshot', 'data': self.api.store.data, 'opportunities': self.api.opportunities}))
+        self.clients.append(writer)
+        try:
+            while True:
+                message = await receive(reader)
+                if message['type'] == 'alert':
+                    self.api.log_alert(message['user'], message['market'], message['bin'], message['value'])
+                elif message['type'] == 'deliver':
+                    self.delivery = writer
+                elif message['type'] == 'sent':
+                    self.in_flight.get(writer, set()).discard(message['id'])
+                    self.api.message_sent(message['id'])
+                elif message['type'] == 'failed':
+                    self.in_flight.get(writer, set()).discard(message['id'])
+                    self.api.message_failed(message['id'])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.drop(writer)
+
+    def drop(self, writer):
+        """
+        Disconnect a client and requeue the notifications it was sent but never confirmed
+        """
+        if writer in self.clients:
+            self.clients.remove(writer)
+        if self.delivery is writer:
+            self.delivery = None
+        for id in self.in_flight.pop(writer, ()):
+            self.api.message_failed(id)
+        writer.close()
+
+    def publish(self, diff):
+        self.broadcast(diff_message(self.api.store, diff))
+
+    def publish_opportunities(self, opportunities):
+        self.broadcast({'type': 'opportunities', 'opportunities': opportunities})
+
+    def broadcast(self, message):
+        data = frame(message)
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                print('hub client fell behind, disconnecting')
+                self.drop(writer)
+            else:
+                writer.write(data)
+
+    async def deliver(self):
+        while True:
+            batch = await self.api.next_messages()
+            if self.delivery is None:
+                for id, msg in batch:
+                    self.api.message_failed(id)
+                await asyncio.sleep(1)
+            else:
+                self.in_flight.setdefault(self.delivery, set()).update(id for id, msg in batch)
+                self.delivery.write(frame({'type': 'messages', 'messages': batch}))
+
+
+if __name__ == '__main__':
+    import main
+
+    hub = Hub(main.Api(), sys.argv[1] if len(sys.argv) > 1 else HUB_PATH)
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(hub.start())
+        loop.run_forever()
+    finally:
+        hub.api.save_cache()
+        hub.api.alerts.flush()
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+
+
+class Journal:
+    """
+    Append-only JSON lines log with a compacted snapshot next to it.
+    Records are buffered and written with a single fsync per flush.
+    Every record carries a sequence number so replay skips what the snapshot already holds.
+    """
+
+    def __init__(self, path):
+        self.log_path = path + '.log'
+        self.snapshot_path = path + '.snapshot'
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.buffer = []
+        self.seq = 0
+        self.logged = 0
+        self.tail = None
+
+    def load(self):
+        """
+        Read the snapshot and the log records written after it, without changing either file.
+        A torn tail left by a crash is skipped, and cut off by this journal's first flush so it writes on a fresh line.
+        :return: (snapshot state or None, list of log records)
+        """
+        state = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                state = json.load(f)
+            self.seq = state['seq']
+        snapshot_seq = self.seq
+        records = []
+        if os.path.exists(self.log_path):
+            good = 0
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    if record['seq'] > snapshot_seq:
+                        records.append(record)
+                        self.seq = record['seq']
+            self.tail = good
+        self.logged = len(records)
+        return state, records
+
+    def append(self, op, **fields):
+        with self.lock:
+            self.seq += 1
+            fields['op'] = op
+            fields['seq'] = self.seq
+            self.buffer.append(fields)
+
+    def flush(self):
+        with self.io_lock:
+            with self.lock:
+                buffer, self.buffer = self.buffer, []
+            if not buffer:
+                return
+            if self.tail is not None:
+                os.truncate(self.log_path, self.tail)
+                self.tail = None
+            with open(self.log_path, 'a') as f:
+                f.write(''.join(json.dumps(record) + '\n' for record in buffer))
+                f.flush()
+                os.fsync(f.fileno())
+            self.logged += len(buffer)
+
+    def compact(self, state):
+        """
+        Replace the snapshot with state and truncate the log
+        :param state: dict describing everything appended so far, taken while no other append can happen
+        """
+        with self.io_lock:
+            with self.lock:
+                state['seq'] = self.seq
+                self.buffer = []
+            temp_path = self.snapshot_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            open(self.log_path, 'w').close()
+            self.tail = None
+            self.logged = 0
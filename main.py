@@ -1,28 +1,44 @@
-import math
-import re
-import requests
-import auths
-import threading
+import asyncio
+import gzip
+import json
+import os
 import time
-import discord
-from fuzzywuzzy import fuzz
+import numpy as np
+from alerts import AlertEngine
+from client import HttpClient, TokenManager, TtlCache, PREDICTIT_URL
+from history import History
+from hub import HUB_PATH, frame, receive
+from journal import Journal
+from workers import Workers
+from store import MarketStore, parse_marketdata
 
 VERBATIM = False
 
 
+def market_risk(shares, prices):
+    """
+    Calculate the outcome of holding no shares if each contract resolves yes
+    :param shares: number of shares of each contract, or a 2d batch with one spread per row
+    :param prices: list of no price of each contract
+    :return: array with the result of each contract resolving yes, one row per spread
+    """
+    shares = np.asarray(shares, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    share_value = shares * prices
+    if_no = np.round((shares - share_value) - 0.1 * (shares - share_value), 3)
+    total = if_no.sum(axis=-1, keepdims=True)
+    return np.round(total - if_no - share_value, 3)
+
+
 def calc_risk(shares: list, prices: list, bin: int) -> float:
     """
-    Calculate the profit of a spread of purchase amounts and no prices
+    Calculate the cost of a spread of purchase amounts if one contract resolves yes
     :param shares: list of number of shares to buy for each contract
     :param prices: list of price of each contract
-    :return: dollar profit amount
+    :param bin: index of the contract that resolves yes
+    :return: dollar cost amount
     """
-    share_value = [shares[i] * prices[i] for i in range(len(prices))]
-    if_no = [round((shares[i] - share_value[i]) - 0.1 * (shares[i] - share_value[i]), 3) for i in
-             range(len(prices))]
-    if_yes = [-(share_value[i]) for i in range(len(prices))]
-    risk = [round(if_yes[i] + sum(if_no[0:i]) + sum(if_no[i + 1:]), 3) for i in range(len(prices))]
-    return 1 - risk[bin]
+    return 1 - float(market_risk(shares, prices)[bin])
 
 
 def calc_profit(shares: list, prices: list) -> float:
@@ -32,13 +48,7 @@ def calc_profit(shares: list, prices: list) -> float:
     :param prices: list of price of each contract
     :return: dollar profit amount
     """
-    share_value = [shares[i] * prices[i] for i in range(len(prices))]
-    if_no = [round((shares[i] - share_value[i]) - 0.1 * (shares[i] - share_value[i]), 3) for i in
-             range(len(prices))]
-    if_yes = [-(share_value[i]) for i in range(len(prices))]
-    risk = [round(if_yes[i] + sum(if_no[0:i]) + sum(if_no[i + 1:]), 3) for i in range(len(prices))]
-    profit = min(risk)
-    return profit
+    return float(market_risk(shares, prices).min())
 
 
 def sum_prices(prices: list) -> float:
@@ -67,147 +77,401 @@ def optShares(cost: float) -> float:
     return 1.0 / (1.0 - (1.0 - float(cost)) * 0.1)
 
 
-def best_amount(prices: list, max_shares: int, test) -> list:
-    costliest = max(prices)
-    share_multiplier = (max_shares / costliest) / optShares(costliest)
-    best_holds = []
-    for i in prices:
-        if not test:
-            best_holds.append([i, math.floor(share_multiplier * optShares(i))])
-        else:
-            best_holds.append([i, 850])
-    return best_holds
+def spread_candidates(prices: list, max_shares: int, test=False) -> tuple:
+    """
+    Build every spread optimize_spread would try, one row per share cap
+    :param prices: list of no price of each contract
+    :param max_shares: largest share cap, rows run from this cap down to 1
+    :return: 2d array with one spread per row and one column per contract
+    """
+    prices = np.asarray(prices, dtype=float)
+    if test:
+        spreads = np.full((1, len(prices)), 850, dtype=np.int64)
+    else:
+        caps = np.arange(max_shares, 0, -1)
+        costliest = prices.max()
+        opt = 1.0 / (1.0 - (1.0 - prices) * 0.1)
+        multiplier = (caps / costliest) / optShares(costliest)
+        spreads = np.floor(multiplier[:, None] * opt[None, :]).astype(np.int64)
+    spreads[:, prices == 1] = 0
+    return spreads
+
+
+def spread_profits(spreads, prices: list):
+    """
+    Calculate the profit of many spreads for one market in a single call
+    :param spreads: 2d array, one spread per row
+    :param prices: list of no price of each contract
+    :return: array with the profit of each row
+    """
+    return market_risk(spreads, prices).min(axis=-1)
 
 
 def optimize_spread(prices: list, max_shares: int, minimum: bool = True, test=False) -> tuple:
-    maximum = max_shares
-    max_profit = 0
-    max_spread = []
-    while maximum > 0:
-        spread = []
-        for i in best_amount(prices, maximum, test):
-            if i[0] != 1:
-                spread.append(i[1])
-            else:
-                spread.append(0)
-        maximum -= 1
-        if not minimum:
-            max_spread = spread
-            max_profit = calc_profit(spread, prices)
-            break
-        elif max(spread) <= max_shares:
-            if calc_profit(spread, prices) > max_profit:
-                max_spread = spread
-                max_profit = calc_profit(spread, prices)
-    return max_spread, max_profit
+    if max_shares <= 0:
+        return [], 0
+    spreads = spread_candidates(prices, max_shares, test)
+    if not minimum:
+        return spreads[0].tolist(), float(spread_profits(spreads[:1], prices)[0])
+    profits = spread_profits(spreads, prices)
+    profits[spreads.max(axis=1) > max_shares] = 0
+    best = int(np.argmax(profits))
+    if profits[best] <= 0:
+        return [], 0
+    return spreads[best].tolist(), float(profits[best])
+
+
+def optimize_markets(markets: list, max_shares: int, minimum: bool) -> list:
+    """
+    Optimize the spread of every market in a compact snapshot
+    :param markets: list of (market id, list of no price of each contract)
+    :return: list of (market id, sum of 1 minus no, profit), negative risk when the profit is positive
+    """
+    results = []
+    for market_id, short in markets:
+        optimal, profit = optimize_spread(short, max_shares, minimum)
+        results.append((market_id, sum_prices(short), profit))
+    return results
+
+
+def divide_prices(prices1: dict, prices2: dict) -> dict:
+    """
+    Divide the yes price of each contract by the yes price of the same contract in another market
+    :return: dict of contract short name to percentage
+    """
+    divided_prices = {}
+    for name, prices in prices1.items():
+        try:
+            if prices['yes'] >= 0.02:
+                divided_prices[name] = int(prices['yes'] / prices2[name]['yes'] * 100)
+        except KeyError:
+            pass
+    return divided_prices
 
 
 class Api:
-    def __init__(self):
-        login_info = {'email': auths.username, 'password': auths.password, 'grant_type': 'password',
-                      'rememberMe': 'false'}
-        r = requests.post('https://www.predictit.org/api/Account/token', login_info)
-        self.token = r.json()['access_token']
-        self.data = requests.get('https://www.predictit.org/api/marketdata/all').json()
-        self.watch = []
-        self.messages = []
-        run_thread = threading.Thread(target=self.run, daemon=True)
-        run_thread.start()
+    def __init__(self, base_url=PREDICTIT_URL, orderbook_limit=8, orderbook_timeout=5, cache_ttl=5, cache_size=512,
+                 alert_path='alerts', flush_interval=1, queue_size=1000, processes=None, command_timeout=30,
+                 history_path='history', snapshot_path=None, cache_path='marketdata.json'):
+        self.http = HttpClient(base_url)
+        self.cache = TtlCache(cache_ttl, cache_size)
+        self.workers = Workers(processes, command_timeout)
+        self.scan_memo = {}
+        self.opportunities = None
+        self.orderbook_limit = orderbook_limit
+        self.orderbook_timeout = orderbook_timeout
+        self.tokens = TokenManager(self.login)
+        self.store = None
+        self.etag = None
+        self.last_modified = None
+        self.alerts = AlertEngine(Journal(alert_path) if alert_path else None, listener=self.notify)
+        self.history = History(history_path) if history_path else None
+        self.snapshot_path = snapshot_path
+        self.cache_path = cache_path
+        self.loaded = None
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.loop = None
+        self.notifications = None
+        self.queued = set()
+        self.reload_listeners = []
+        self.opportunity_listeners = []
+        self.hub = None
+        self.scan_lock = None
+
+    async def start(self):
+        """
+        Start without any network round trip: load the snapshot saved at the last shutdown if there is one,
+        and fetch a fresh one in the background. The token is fetched by the first call that needs it.
+        """
+        self.loop = asyncio.get_event_loop()
+        self.notifications = asyncio.Queue(self.queue_size)
+        self.scan_lock = asyncio.Lock()
+        self.loaded = asyncio.Event()
+        self.requeue()
+        if self.cache_path and os.path.exists(self.cache_path):
+            self.replace_store(await self.loop.run_in_executor(None, self.load_cache), notify=False)
+            self.loaded.set()
+        asyncio.ensure_future(self.warm())
+        asyncio.ensure_future(self.run())
+        asyncio.ensure_future(self.persist())
+
+    async def warm(self):
+        while True:
+            try:
+                await self.reload(notify=False)
+            except Exception as e:
+                print('initial reload failed: ' + repr(e))
+            if self.store is not None:
+                break
+            await asyncio.sleep(5)
+        self.loaded.set()
+
+    def load_cache(self):
+        with open(self.cache_path, 'rb') as f:
+            return MarketStore(parse_marketdata(f.read()))
+
+    def save_cache(self):
+        """
+        Write the current snapshot to cache_path so the next start has data before its first reload
+        """
+        if not self.cache_path or self.store is None:
+            return
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.store.data, f)
+        os.replace(temp_path, self.cache_path)
+
+    async def wait_loaded(self):
+        if self.store is None:
+            await self.loaded.wait()
+
+    async def follow(self, path=HUB_PATH, deliver=True):
+        """
+        Take the snapshot, diffs, negative risk table and notifications from a hub.py process instead of
+        polling PredictIt. Only the hub records history, a follower reads the same directory.
+        :param deliver: ask the hub to send this process the alert and scan notifications
+        """
+        self.loop = asyncio.get_event_loop()
+        self.notifications = asyncio.Queue(self.queue_size)
+        self.scan_lock = asyncio.Lock()
+        reader = await self.connect(path, deliver)
+        asyncio.ensure_future(self.listen(reader, path, deliver))
+
+    async def connect(self, path, deliver):
+        reader, self.hub = await asyncio.open_unix_connection(path)
+        snapshot = await receive(reader)
+        data = snapshot['data']
+        self.opportunities = snapshot['opportunities']
+        self.replace_store(await self.loop.run_in_executor(None, MarketStore, data, self.store), notify=False)
+        if deliver:
+            self.hub.write(frame({'type': 'deliver'}))
+        return reader
+
+    async def listen(self, reader, path, deliver):
+        while True:
+            try:
+                message = await receive(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                print('lost the market data hub, reconnecting')
+                reader = await self.reconnect(path, deliver)
+                continue
+            if message['type'] == 'diff':
+                store = await self.loop.run_in_executor(None, self.apply_diff, message)
+                self.replace_store(store, notify=False)
+            elif message['type'] == 'opportunities':
+                self.opportunities = message['opportunities']
+            elif message['type'] == 'messages':
+                for id, msg in message['messages']:
+                    self.enqueue(id, msg)
+
+    async def reconnect(self, path, deliver, delay=5):
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                return await self.connect(path, deliver)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                print('market data hub unavailable: ' + repr(e))
+
+    def apply_diff(self, message):
+        markets = dict(self.store.markets)
+        for id in message['removed']:
+            markets.pop(id, None)
+        for market in message['markets']:
+            markets[str(market['id'])] = market
+        order = message['order'] or markets
+        return MarketStore({'markets': [markets[id] for id in order]}, self.store)
+
+    @property
+    def data(self):
+        return self.store.data
 
     def log_alert(self, user, market, bin, value):
-        self.watch.append({'user': user, 'market': market, 'bin': bin, 'value': value})
-        print(self.watch)
+        if self.hub is not None:
+            self.hub.write(frame({'type': 'alert', 'user': user, 'market': market, 'bin': bin, 'value': value}))
+            return
+        print(self.alerts.add(user, market, bin, value))
 
     def get_messages(self):
-        return self.messages
-
-    def check_alerts(self):
-        for i, wat in enumerate(self.watch):
-            for market in self.data['markets']:
-                market_id = str(market['id'])
-                if market_id == str(wat['market']):
-                    contract = market['contracts'][wat['bin']]
-                    if wat['value'] < 0:
-                        if contract['bestBuyYesCost'] * 100 <= abs(wat['value']):
-                            msg = wat['user'] + " Market " + market_id + " just dropped below " + str(
-                                -wat['value']) + '\n'
-                            msg += "Currently at " + str(int(contract['bestBuyYesCost'] * 100)) + '¢'
-                            self.messages += [msg]
-                            self.watch.pop(i)
-                    else:
-                        if contract['bestBuyYesCost'] * 100 >= wat['value']:
-                            msg = wat['user'] + " Market " + market_id + " just went above " + str(wat['value']) + '\n'
-                            msg += "Currently at " + str(int(contract['bestBuyYesCost'] * 100)) + '¢'
-                            self.messages += [msg]
-                            self.watch.pop(i)
-
-    def run(self):
+        return self.alerts.pending()
+
+    def message_sent(self, id):
+        self.queued.discard(id)
+        if self.hub is not None:
+            self.hub.write(frame({'type': 'sent', 'id': id}))
+        else:
+            self.alerts.delivered(id)
+
+    def message_failed(self, id):
+        self.queued.discard(id)
+        if self.hub is not None:
+            self.hub.write(frame({'type': 'failed', 'id': id}))
+
+    def notify(self, id, msg):
+        """
+        Hand a message to the event loop, safe to call from any thread
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.enqueue, id, msg)
+
+    def enqueue(self, id, msg):
+        if id in self.queued or self.notifications.full():
+            return
+        self.queued.add(id)
+        self.notifications.put_nowait((id, msg))
+
+    def requeue(self):
+        for id, msg in self.alerts.pending():
+            self.enqueue(id, msg)
+
+    async def next_messages(self, window=0.5, limit=50):
+        """
+        Wait for the next notification and collect whatever else arrives within window seconds.
+        Messages that did not fit in the queue stay in the outbox and are queued again once it drains.
+        :return: list of (id, message) pairs
+        """
+        if self.notifications.empty():
+            self.requeue()
+        batch = [await self.notifications.get()]
+        deadline = self.loop.time() + window
+        while len(batch) < limit:
+            if self.notifications.empty():
+                self.requeue()
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.notifications.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def check_alerts(self, diff=None):
+        self.alerts.check(self.store.columns, diff)
+
+    async def persist(self):
+        loop = asyncio.get_event_loop()
         while True:
-            time.sleep(60)
-            self.reload()
-            self.check_alerts()
+            await asyncio.sleep(self.flush_interval)
+            await loop.run_in_executor(None, self.alerts.flush)
 
-    def reload(self):
-        response = requests.get('https://www.predictit.org/api/marketdata/all')
-        if response.status_code == 503:
+    async def run(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                await self.reload()
+            except Exception as e:
+                print('reload failed: ' + repr(e))
+
+    async def reload(self, notify=True):
+        """
+        Fetch marketdata/all if it changed since the last reload. A hub follower keeps the snapshot
+        the hub sent it and never fetches.
+        :param notify: announce alerts and negative risk changes, off while starting up
+        :return: SnapshotDiff against the previous snapshot, or None if nothing was loaded
+        """
+        if self.hub is not None:
+            return None
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        response = await self.http.get('marketdata/all', headers=headers)
+        if response.status == 503:
             print('server down')
-        else:
-            self.data = response.json()
+            return None
+        if response.status == 304:
+            return None
+        previous = self.store
+        loop = asyncio.get_event_loop()
+        store = await loop.run_in_executor(None, lambda: MarketStore(parse_marketdata(response.body), previous))
+        self.replace_store(store, notify)
+        if self.history is not None:
+            await loop.run_in_executor(None, self.history.record, store.columns, time.time())
+        if self.snapshot_path:
+            await loop.run_in_executor(None, self.save_snapshot, response.body)
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        return store.diff
+
+    def replace_store(self, store, notify=True):
+        """
+        Switch to a new snapshot and run everything that depends on what changed in it:
+        cache invalidation, reload listeners, alert checks and the negative risk table.
+        A hub follower takes the table from the hub instead of scanning.
+        """
+        self.store = store
+        for market_id in store.diff.changed:
+            self.cache.invalidate(('Contracts', market_id))
+            for contract_id in store.diff.changed[market_id]:
+                self.cache.invalidate(('OrderBook', contract_id))
+        if store.diff:
+            for listener in self.reload_listeners:
+                listener(store.diff)
+            if notify:
+                self.check_alerts(store.diff)
+            if self.hub is None:
+                asyncio.ensure_future(self.update_opportunities(store.diff, notify))
+
+    def save_snapshot(self, body):
+        """
+        Keep the raw marketdata/all body so backtest.py can replay it
+        """
+        os.makedirs(self.snapshot_path, exist_ok=True)
+        with gzip.open(os.path.join(self.snapshot_path, str(int(time.time())) + '.json.gz'), 'wb') as f:
+            f.write(body)
+
+    async def login(self):
+        """
+        Credentials are read at the first login, so this module imports and starts without auths.py
+        :return: (access token, seconds until it expires)
+        """
+        import auths
 
-    def get_auth(self):
         login_info = {'email': auths.username, 'password': auths.password, 'grant_type': 'password',
                       'rememberMe': 'false'}
-        r = requests.post('https://www.predictit.org/api/Account/token', login_info)
-        self.token = r.json()['access_token']
-
-    def get_orderbook(self, id):
-        return requests.get('https://www.predictit.org/api/Trade/' + str(id) + '/OrderBook',
-                            headers={'Authorization': 'Bearer ' + self.token}).json()
+        r = (await self.http.post('Account/token', data=login_info)).json()
+        return r['access_token'], float(r.get('expires_in', 3600))
+
+    async def get_auth(self):
+        return await self.tokens.refresh()
+
+    async def get_orderbook(self, id):
+        async def fetch():
+            token = await self.tokens.get()
+            for attempt in range(2):
+                response = await self.http.get('Trade/' + str(id) + '/OrderBook',
+                                               headers={'Authorization': 'Bearer ' + token})
+                if response.status != 401:
+                    book = response.json()
+                    if 'yesOrders' in book:
+                        return book
+                if attempt == 0:
+                    token = await self.tokens.refresh(rejected=token)
+            raise KeyError('no orderbook for contract ' + str(id))
+        return await self.cache.get(('OrderBook', str(id)), fetch)
 
     def get_market_name(self, id):
-        id = str(id)
-        for market in self.data['markets']:
-            if str(market['id']) == id:
-                return str(market['name'])
-        return 'Market Not Found'
+        market = self.store.market(id)
+        if market is None:
+            return 'Market Not Found'
+        return str(market['name'])
 
     def get_market_url(self, id):
-        id = str(id)
-        for market in self.data['markets']:
-            if str(market['id']) == id:
-                return str(market['url'])
-        return 'Market Not Found'
+        market = self.store.market(id)
+        if market is None:
+            return 'Market Not Found'
+        return str(market['url'])
 
     def get_market_id(self, guess):
-        guess = re.sub(r'[^\w\s]', '', guess).lower()
-        guess_words = guess.split()
-        most_matches = 0
-        best_diff = 0
-        best_diff_id = 0
-        for market in self.data['markets']:
-            short_name = re.sub(r'[^\w\s]', '', market['shortName']).lower()
-            long_name = re.sub(r'[^\w\s]', '', market['name']).lower()
-            matches = sum([word in short_name or word in long_name for word in guess_words])
-            if guess == short_name or guess == long_name:
-                return market['id']
-            diff1 = fuzz.token_sort_ratio(guess, short_name)
-            diff2 = fuzz.token_sort_ratio(guess, long_name)
-            if matches > most_matches or (matches >= most_matches and (diff1 > best_diff or diff2 > best_diff)):
-                best_diff = max(diff1, diff2)
-                best_diff_id = market['id']
-            if matches > most_matches:
-                most_matches = matches
-        return best_diff_id
-
-    def get_contract_offers(self, id, top=False):
-        book = self.get_orderbook(id)
+        return self.store.search.find(guess)
+
+    async def get_contract_offers(self, id, top=False):
+        book = await self.get_orderbook(id)
         offers = {'yes': {}, 'no': {}}
-        try:
-            yes_orders = book['yesOrders']
-            no_orders = book['noOrders']
-        except KeyError:
-            self.get_auth()
-            return self.get_contract_offers(id, top)
+        yes_orders = book['yesOrders']
+        no_orders = book['noOrders']
         if not top:
             for order in yes_orders:
                 offers['yes'][order['pricePerShare']] = order['quantity']
@@ -221,24 +485,34 @@ class Api:
                 offers['no'][no['pricePerShare']] = no['quantity']
         return offers
 
-    def get_market_orderbooks(self, id, top=False):
+    async def get_market_orderbooks(self, id, top=False):
         bins = {}
-        id = str(id)
-        for market in self.data['markets']:
-            if str(market['id']) == id:
-                for contract in market['contracts']:
-                    id = contract['id']
-                    if top and contract['bestBuyNoCost']:
-                        offers = self.get_contract_offers(id, top)
-                        name = contract['name']
-                        bins[name] = {}
-                        bins[name]['yes'] = list(offers['yes'].items())
-                        bins[name]['no'] = list(offers['no'].items())
+        market = self.store.market(id)
+        if market is None:
+            return bins
+        contracts = [contract for contract in market['contracts'] if top and contract['bestBuyNoCost']]
+        semaphore = asyncio.Semaphore(self.orderbook_limit)
+
+        async def fetch(contract):
+            async with semaphore:
+                return await asyncio.wait_for(self.get_contract_offers(contract['id'], top), self.orderbook_timeout)
+
+        books = await asyncio.gather(*[fetch(contract) for contract in contracts], return_exceptions=True)
+        for contract, offers in zip(contracts, books):
+            name = contract['name']
+            if isinstance(offers, Exception):
+                bins[name] = None
+                continue
+            bins[name] = {}
+            bins[name]['yes'] = list(offers['yes'].items())
+            bins[name]['no'] = list(offers['no'].items())
         return bins
 
-    def get_all_offers(self, id):
+    async def get_all_offers(self, id):
+        async def fetch():
+            return (await self.http.get('Market/' + str(id) + '/Contracts')).json()
         try:
-            market_data = requests.get('https://www.predictit.org/api/Market/' + str(id) + '/Contracts').json()
+            market_data = await self.cache.get(('Contracts', str(id)), fetch)
         except:
             assert True, "market not found"
         bins = {}
@@ -264,50 +538,115 @@ class Api:
             long.append(bin['yes_cost'])
         return long
 
-    def sum_market_shorts(self, market):
-        bins = self.get_all_offers(market)
+    async def sum_market_shorts(self, market):
+        bins = await self.get_all_offers(market)
         return sum_prices(self.get_all_short(bins))
 
-    def optimize_all(self, max_shares=850, minimum=False, compressed=True):
-        title = "There are {} markets with negative risk.\n"
-        n = 0
+    async def scan_all(self, max_shares=850, minimum=False, market_ids=None):
+        """
+        Look for negative risk in every market, split across the worker processes.
+        Markets whose no prices are unchanged since the last scan reuse the previous result.
+        :param market_ids: only scan these markets
+        :return: async iterator of lists of (market id, sum of 1 minus no, profit), one list per finished shard
+        """
+        markets = self.store.short_prices(market_ids, candidates_only=True)
+        memo = {} if market_ids is None else dict(self.scan_memo)
+        cached = []
+        todo = []
+        for market_id, short in markets:
+            key = (tuple(short), max_shares, minimum)
+            entry = self.scan_memo.get(market_id)
+            if entry is not None and entry[0] == key:
+                memo[market_id] = entry
+                cached.append(entry[1])
+            else:
+                todo.append((market_id, short))
+        self.scan_memo = memo
+        yield [result for result in cached if result[2] > 0]
+        prices = dict(todo)
+        shards = min(len(todo), self.workers.size())
+        runs = [asyncio.ensure_future(self.workers.run(optimize_markets, todo[i::shards], max_shares, minimum))
+                for i in range(shards)]
+        try:
+            for run in asyncio.as_completed(runs):
+                results = await run
+                for result in results:
+                    memo[result[0]] = ((tuple(prices[result[0]]), max_shares, minimum), result)
+                yield [result for result in results if result[2] > 0]
+        finally:
+            for run in runs:
+                run.cancel()
+
+    async def update_opportunities(self, diff, notify=True):
+        """
+        Rescan the markets in a snapshot diff and keep the negative risk table current,
+        announcing markets that gain or lose negative risk
+        """
+        async with self.scan_lock:
+            try:
+                found = {}
+                async for findings in self.scan_all(market_ids=list(diff.changed)):
+                    for result in findings:
+                        found[str(result[0])] = result
+            except asyncio.TimeoutError:
+                print('negative risk scan timed out')
+                return
+            opportunities = dict(self.opportunities or {})
+            for market_id in list(diff.changed) + diff.removed:
+                if market_id in opportunities and market_id not in found:
+                    del opportunities[market_id]
+                    if notify:
+                        self.alerts.post("Market " + market_id + " no longer has negative risk")
+            for market_id, result in found.items():
+                if market_id not in opportunities and notify:
+                    msg = "Negative risk found in market " + market_id + ' (' + str(result[1]) + ' / $' + str(result[2]) + ')'
+                    self.alerts.post(msg)
+                opportunities[market_id] = result
+            self.opportunities = opportunities
+            for listener in self.opportunity_listeners:
+                listener(opportunities)
+
+    def ranked_opportunities(self):
+        return sorted(self.opportunities.values(), key=lambda result: -result[2])
+
+    def format_findings(self, found, compressed=True, done=True, ranked=False):
+        if done:
+            title = "There are {} markets with negative risk.\n"
+        else:
+            title = "Found {} markets with negative risk so far...\n"
+        if not ranked:
+            order = {market['id']: i for i, market in enumerate(self.store)}
+            found = sorted(found, key=lambda result: order.get(result[0], len(order)))
         msg = '```'
-        for market in self.data['markets']:
-            if len(market['contracts']) > 1:
-                short = []
-                for contract in market['contracts']:
-                    price = contract['bestBuyNoCost']
-                    if price is not None:
-                        short += [price]
-                    else:
-                        short += [1]
-                potential = sum_prices(short)
-                optimal, profit = optimize_spread(short, max_shares, minimum)
-                market_id = market['id']
-                if profit > 0:
-                    n += 1
-                    if not compressed:
-                        msg += "Market " + str(market_id) + '\n'
-                        msg += "   Sum of 1 minus no is " + str(potential) + "\n"
-                        msg += "   Potential profit is $" + str(profit) + " with the ideal spread\n"
-                    else:
-                        msg += "Market " + str(market_id) + ' (' + str(potential) + ' / $' + str(profit) + ')\n'
+        for market_id, potential, profit in found:
+            if not compressed:
+                msg += "Market " + str(market_id) + '\n'
+                msg += "   Sum of 1 minus no is " + str(potential) + "\n"
+                msg += "   Potential profit is $" + str(profit) + " with the ideal spread\n"
+            else:
+                msg += "Market " + str(market_id) + ' (' + str(potential) + ' / $' + str(profit) + ')\n'
         msg += '```'
-        return title.format(str(n)), msg
+        return title.format(str(len(found))), msg
+
+    async def optimize_all(self, max_shares=850, minimum=False, compressed=True):
+        found = []
+        async for findings in self.scan_all(max_shares, minimum):
+            found += findings
+        return self.format_findings(found, compressed)
 
-    def opt_neg_risk(self, market, max_shares, minimum):
+    async def opt_neg_risk(self, market, max_shares, minimum):
         assert max_shares > 0, 'Max shares must be positive'
-        self.reload()
+        await self.reload()
         VERBATIM and print()
         VERBATIM and print('Optimizing negative risk')
-        bins = self.get_all_offers(market)
+        bins = await self.get_all_offers(market)
         short = self.get_all_short(bins)
         spread, risk = optimize_spread(short, max_shares, minimum)
         VERBATIM and print('Profit:' + str(risk))
         VERBATIM and print(spread)
         return spread, risk
 
-    def discord_orderbook(self, market_id):
+    async def discord_orderbook(self, market_id):
         input = str(market_id)
         try:
             int(market_id)
@@ -319,7 +658,7 @@ class Api:
             return 'Market "' + str(input) + '" Not Found'
         title = 'Orderbook for "' + name + '"\n'
         url = self.get_market_url(market_id)
-        offers = self.get_market_orderbooks(market_id, top=True)
+        offers = await self.get_market_orderbooks(market_id, top=True)
         max_len = 0
         for name, book in offers.items():
             if len(name) > max_len:
@@ -328,6 +667,9 @@ class Api:
         msg += '```'
         msg += ' ' * (max_len + 2) + 'YES  OFFERS  NO  OFFERS\n'
         for name, book in offers.items():
+            if book is None:
+                msg += ' ' * (max_len - len(name)) + str(name) + '  unavailable\n'
+                continue
             yes = book['yes']
             no = book['no']
             msg += ' ' * (max_len - len(name)) + str(name)
@@ -340,7 +682,43 @@ class Api:
         msg += '```'
         return title, msg, url
 
-    def get_market_risk(self, market, max_shares=850, minimum=True):
+    async def get_market_history(self, market_id, hours=24):
+        """
+        Show how the yes price of every bin moved over the last hours
+        :return: (title, info, url)
+        """
+        input = str(market_id)
+        try:
+            int(market_id)
+            name = self.get_market_name(market_id)
+        except:
+            market_id = self.get_market_id(market_id)
+            name = self.get_market_name(market_id)
+        if self.history is None:
+            return 'Price history unavailable', '', None
+        if name == 'Market Not Found':
+            return 'Market "' + str(input) + '" Not Found', '', None
+        market = self.store.market(market_id)
+        title = 'Last ' + str(hours) + 'h of "' + name + '"\n'
+        end = time.time()
+        loop = asyncio.get_event_loop()
+        series = await loop.run_in_executor(None, self.history.contract_series,
+                                            [contract['id'] for contract in market['contracts']], end - hours * 3600, end)
+        max_len = max(len(contract['name']) for contract in market['contracts'])
+        info = '```' + ' ' * max_len + ' THEN  NOW  LOW HIGH\n'
+        for contract in market['contracts']:
+            times, yes, no, last = series[contract['id']]
+            yes = yes[~np.isnan(yes)]
+            if not len(yes):
+                continue
+            info += ' ' * (max_len - len(contract['name'])) + contract['name']
+            for price in (yes[0], yes[-1], yes.min(), yes.max()):
+                info += ' ' * (5 - len(str(int(round(price * 100))))) + str(int(round(price * 100)))
+            info += '\n'
+        info += '```'
+        return title, info, market['url']
+
+    async def get_market_risk(self, market, max_shares=850, minimum=True):
         input = str(market)
         market = input
         try:
@@ -354,15 +732,15 @@ class Api:
             return 'Market "' + str(input) + '" Not Found'
         info = ''
         title = 'Market risk for "' + name + '"\n'
-        bins = self.get_all_offers(market)
+        bins = await self.get_all_offers(market)
         short = self.get_all_short(bins)
-        spread, risk = optimize_spread(short, max_shares, minimum)
+        spread, risk = await self.workers.run(optimize_spread, short, max_shares, minimum)
         if risk < 0:
             info += 'No negative risk available at ' + str(max_shares) + ' shares'
         else:
             info += 'Negative risk found!!!\n'
             spread = list(filter(lambda x: x != 0, spread))
-            info += 'Sum of 1 minus no is ' + str(self.sum_market_shorts(market)) + '\n'
+            info += 'Sum of 1 minus no is ' + str(await self.sum_market_shorts(market)) + '\n'
             info += 'Potential profit w/ below spread is ' + str(risk) + '\n'
             info += 'Ideal spread is ' + str(spread) + '\n'
         return title, info, url
@@ -380,37 +758,36 @@ class Api:
         info = ''
         title = ''
         title += 'Market bins for "' + name + '"\n'
-        for market in self.data['markets']:
-            if str(market['id']) == str(market_id):
-                url = market['url']
-                max_len = 0
-                for contract in market['contracts']:
-                    if len(contract['name']) > max_len:
-                        max_len = len(contract['name'])
-                info += '```'
-                rest = []
-                info += ' ' * (max_len + 2) + 'YES NO\n'
-                for contract in market['contracts']:
-                    if contract['bestBuyNoCost'] is not None:
-                        info += ' ' * (max_len - len(contract['name'])) + str(contract['name']) + '  '
-                        info += ' ' * (2 - len(str(int(contract['bestBuyYesCost'] * 100)))) + str(
-                            int(contract['bestBuyYesCost'] * 100)) + '  '
-                        info += ' ' * (2 - len(str(int(contract['bestBuyNoCost'] * 100)))) + str(
-                            int(contract['bestBuyNoCost'] * 100)) + '\n'
-                    else:
-                        rest.append(str(contract['name']))
-                n = 0
-                for contract in rest:
-                    if n < 2:
-                        info += contract + ', '
-                    n += 1
-                if rest:
-                    info = info[:-2] + ' and ' + str(n - 2) + ' more @ 0'
-
-                info += '```'
+        market = self.store.market(market_id)
+        url = market['url']
+        max_len = 0
+        for contract in market['contracts']:
+            if len(contract['name']) > max_len:
+                max_len = len(contract['name'])
+        info += '```'
+        rest = []
+        info += ' ' * (max_len + 2) + 'YES NO\n'
+        for contract in market['contracts']:
+            if contract['bestBuyNoCost'] is not None:
+                info += ' ' * (max_len - len(contract['name'])) + str(contract['name']) + '  '
+                info += ' ' * (2 - len(str(int(contract['bestBuyYesCost'] * 100)))) + str(
+                    int(contract['bestBuyYesCost'] * 100)) + '  '
+                info += ' ' * (2 - len(str(int(contract['bestBuyNoCost'] * 100)))) + str(
+                    int(contract['bestBuyNoCost'] * 100)) + '\n'
+            else:
+                rest.append(str(contract['name']))
+        n = 0
+        for contract in rest:
+            if n < 2:
+                info += contract + ', '
+            n += 1
+        if rest:
+            info = info[:-2] + ' and ' + str(n - 2) + ' more @ 0'
+
+        info += '```'
         return title, info, url
 
-    def value_buy(self, market_id, bin):
+    async def value_buy(self, market_id, bin):
         input = str(market_id)
         try:
             int(market_id)
@@ -421,7 +798,7 @@ class Api:
         if name == 'Market Not Found':
             return 'Market "' + str(input) + '" Not Found'
         info = 'Finding value buy for "' + name + '"\n'
-        bins = self.get_all_offers(market_id)
+        bins = await self.get_all_offers(market_id)
         short = self.get_all_short(bins)
         long = self.get_all_long(bins)
         if len(long) <= 1:
@@ -431,26 +808,27 @@ class Api:
                 bin = long.index(max(long))
             info += "Buying B" + str(bin + 1) + " Yes costs " + str(int(long[bin] * 100)) + '¢\n'
             buys = [1 if i != bin and j != 1 else 0 for i, j in enumerate(short)]
-            info += "Buying No on everything else would cost " + str(int(calc_risk(buys, short, bin) * 100)) + '¢'
+            cost = await self.workers.run(calc_risk, buys, short, bin)
+            info += "Buying No on everything else would cost " + str(int(cost * 100)) + '¢'
         return info
 
     def get_related_market_bins(self, bin_name):
         bin_name = bin_name.lower()
         msg = 'Looking for markets containing "' + bin_name + '" as a bin\n'
-        n = 0
         m = 1
         for letter in bin_name:
             if letter == '+':
                 m += 1
         bin_name = bin_name.strip('+')
         bin_name_words = bin_name.split()
-        for market in self.data['markets']:
-            for contract in market['contracts']:
-                if all([bin_name in contract['name'].lower() for bin_name in bin_name_words]):
-                    if (20 * m) > n >= (20 * (m - 1)):
-                        msg += market['shortName'] + ' (' + str(market['id']) + ') ' + str(
-                            int(contract['lastTradePrice'] * 100)) + '¢\n'
-                    n += 1
+        hits = self.store.contract_names.search(bin_name_words, limit=20 * m)
+        n = len(hits)
+        page = hits[20 * (m - 1):]
+        cents = (self.store.columns.last[page] * 100).tolist()
+        for position, price in zip(page, cents):
+            market = self.store.contract_market(self.store.contract_list[position]['id'])
+            price = str(int(price)) + '¢' if price == price else 'no trades'
+            msg += market['shortName'] + ' (' + str(market['id']) + ') ' + price + '\n'
         if n == 0:
             msg += "No markets found!"
         elif n >= 15 * m:
@@ -460,19 +838,17 @@ class Api:
     def get_related_markets(self, name_frag):
         name_frag = name_frag.lower()
         msg = 'Looking for markets containing "' + name_frag + '" in the title\n'
-        n = 0
         m = 1
         for letter in name_frag:
             if letter == '+':
                 m += 1
         name_frag = name_frag.strip('+')
         name_frag_words = name_frag.split()
-        for market in self.data['markets']:
-            if all([name_frag in market['name'].lower() or name_frag in market['shortName'].lower() for name_frag in
-                    name_frag_words]):
-                if (20 * m) > n >= (20 * (m - 1)):
-                    msg += market['shortName'] + ' (' + str(market['id']) + ')\n'
-                n += 1
+        hits = self.store.titles.search(name_frag_words, limit=20 * m)
+        n = len(hits)
+        for position in hits[20 * (m - 1):]:
+            market = self.store.data['markets'][position]
+            msg += market['shortName'] + ' (' + str(market['id']) + ')\n'
         if n == 0:
             msg += "No markets found!"
         elif n >= 15 * m:
@@ -481,23 +857,16 @@ class Api:
 
     def get_prices(self, market_id):
         prices = {}
-        for market in self.data["markets"]:
-            if str(market['id']) == str(market_id):
-                for contract in market['contracts']:
-                    prices[contract['shortName']] = {'yes': contract['bestBuyYesCost'], 'no': contract['bestBuyNoCost']}
+        market = self.store.market(market_id)
+        if market is None:
+            return prices
+        for contract in market['contracts']:
+            prices[contract['shortName']] = {'yes': contract['bestBuyYesCost'], 'no': contract['bestBuyNoCost']}
         return prices
 
-    def divide_bins(self, market1, market2):
-        self.reload()
-        market1_prices = self.get_prices(market1)
-        market2_prices = self.get_prices(market2)
-        divided_prices = {}
-        for name, prices in market1_prices.items():
-            try:
-                if prices['yes'] >= 0.02:
-                    divided_prices[name] = int(prices['yes'] / market2_prices[name]['yes'] * 100)
-            except KeyError:
-                pass
+    async def divide_bins(self, market1, market2):
+        await self.reload()
+        divided_prices = await self.workers.run(divide_prices, self.get_prices(market1), self.get_prices(market2))
         print('Getting Difference')
         msg = ""
         for name, div in divided_prices.items():
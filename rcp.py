@@ -0,0 +1,96 @@
+import asyncio
+import json
+from collections import Counter
+from client import HttpClient, TtlCache
+
+RCP_URL = 'https://www.realclearpolitics.com/epolls/json/'
+
+# (names the command accepts, title, RCP poll id)
+REGIONS = [
+    (('national', 'nation'), 'the nation', 6730),
+    (('iowa', 'ia'), 'Iowa', 6731),
+    (('nevada', 'nv'), 'Nevada', 6866),
+    (('new hampshire', 'nh'), 'New Hampshire', 6276),
+    (('south carolina', 'sc'), 'South Carolina', 6824),
+    (('california', 'ca'), 'California', 6879),
+    (('texas', 'tx'), 'Texas', 6875),
+    (('massachusetts', 'ma'), 'Massachusetts', 6786),
+]
+
+
+def parse_average(body):
+    """
+    Read the latest average out of an RCP historical JSONP file without decoding the whole history
+    :param body: raw response bytes, e.g. return_json({"poll": {"rcp_avg": [...], ...}});
+    :return: list of (candidate name, average) for every candidate with an average
+    """
+    text = body.decode('utf-8')
+    start = text.index('[', text.index('"rcp_avg"')) + 1
+    while text[start].isspace():
+        start += 1
+    latest = json.JSONDecoder().raw_decode(text, start)[0]
+    return [(candidate['name'], candidate['value']) for candidate in latest['candidate'] if candidate['value']]
+
+
+class Region:
+    def __init__(self, names, title, poll):
+        self.names = names
+        self.title = title
+        self.poll = poll
+
+
+class RcpService:
+    """
+    Latest RCP polling averages by region, cached for ttl seconds.
+    A background refresher keeps the national average and the most asked for regions warm.
+    """
+
+    def __init__(self, http=None, base_url=RCP_URL, regions=REGIONS, ttl=600, refresh_interval=300, warm=3):
+        self.http = http or HttpClient()
+        self.base_url = base_url
+        self.cache = TtlCache(ttl, len(regions))
+        self.refresh_interval = refresh_interval
+        self.warm = warm
+        self.regions = {}
+        for names, title, poll in regions:
+            region = Region(names, title, poll)
+            for name in names:
+                self.regions[name] = region
+        self.default = self.regions[regions[0][0][0]]
+        self.requests = Counter()
+
+    def region(self, keyword):
+        return self.regions.get(keyword.lower().strip())
+
+    def names(self):
+        return ', '.join(sorted({region.names[0] for region in self.regions.values()}))
+
+    async def fetch(self, region):
+        response = await self.http.get(self.base_url + str(region.poll) + '_historical.js')
+        return parse_average(response.body)
+
+    async def latest(self, keyword):
+        """
+        :param keyword: any name of a region
+        :return: (title, list of (candidate name, average)), or None if the region is unknown
+        """
+        region = self.region(keyword)
+        if region is None:
+            return None
+        self.requests[region.poll] += 1
+        averages = await self.cache.get(('rcp', region.poll), lambda: self.fetch(region))
+        return 'RCP average for ' + region.title, averages
+
+    async def refresh(self):
+        polls = {self.default.poll} | {poll for poll, count in self.requests.most_common(self.warm)}
+        for region in {region.poll: region for region in self.regions.values()}.values():
+            if region.poll in polls:
+                try:
+                    self.cache.put(('rcp', region.poll), await self.fetch(region))
+                except Exception as e:
+                    print('rcp refresh of ' + region.title + ' failed: ' + repr(e))
+
+    async def run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+
+class Feed:
+    """
+    One live results json in the NYT format, with a name index of its counties and townships
+    """
+
+    def __init__(self, name, title, url, candidates, channel=None, interval=5):
+        """
+        :param name: command name, e.g. 'nh' answers ,nh
+        :param title: shown in embeds, e.g. 'NH'
+        :param url: results json
+        :param candidates: last names to report
+        :param channel: discord channel id updates are posted to
+        :param interval: seconds between polls
+        """
+        self.name = name
+        self.title = title
+        self.url = url
+        self.candidates = candidates
+        self.channel = channel
+        self.interval = interval
+        self.etag = None
+        self.last_modified = None
+        self.body = None
+        self.race = None
+        self.places = {}
+
+    def update(self, race):
+        """
+        Replace the current race results
+        :return: (dict of last name to votes of the candidates that changed, names of the places that changed)
+        """
+        previous = self.race
+        places = {}
+        for kind in ('counties', 'townships'):
+            for place in race.get(kind, ()):
+                places.setdefault(place['name'].lower(), place)
+        old_votes = self.votes() if previous is not None else {}
+        changed_places = [place['name'] for key, place in places.items() if self.places.get(key) != place]
+        self.race = race
+        self.places = places
+        changed = {name: votes for name, votes in self.votes().items() if old_votes.get(name) != votes}
+        return changed, changed_places
+
+    def votes(self):
+        return {candidate['last_name']: candidate['votes'] for candidate in self.race['candidates']
+                if candidate['last_name'] in self.candidates}
+
+    def summary(self, only=None):
+        """
+        Statewide votes and share of every tracked candidate, or of the ones in only
+        """
+        msg = "```"
+        for candidate in self.race['candidates']:
+            name = candidate['last_name']
+            if name in self.candidates and (only is None or name in only):
+                msg += name + "  " + ' ' * (9 - len(name)) + str(candidate['votes']) + ' ' * (
+                    5 - len(str(candidate['votes']))) + "  " + candidate['percent_display'] + "%\n"
+        msg += str(self.race['precincts_reporting']) + "/" + str(self.race['precincts_total']) + " reporting\n"
+        msg += "```"
+        return msg
+
+    def place(self, name):
+        """
+        :return: message with the results of a county or township, or None if there is no such place
+        """
+        place = self.places.get(name.lower().strip())
+        if place is None:
+            return None
+        msg = "```"
+        for result, num in place['results'].items():
+            for key in self.candidates:
+                if key.lower() in result:
+                    msg += key + "  " + ' ' * (9 - len(key)) + str(num) + '\n'
+        if 'reporting' in place:
+            msg += str(place['reporting']) + "/" + str(place['precincts']) + " reporting\n"
+        msg += "```"
+        return msg
+
+
+class ResultsPoller:
+    """
+    Polls every feed on its own interval with conditional requests and reports only what changed
+    """
+
+    def __init__(self, http, feeds, listener=None):
+        """
+        :param http: client.HttpClient
+        :param feeds: list of Feed
+        :param listener: coroutine function called with (feed, changed candidates, changed places)
+        """
+        self.http = http
+        self.feeds = {feed.name: feed for feed in feeds}
+        self.listener = listener
+
+    def feed(self, name):
+        return self.feeds.get(name)
+
+    async def fetch(self, feed):
+        """
+        Fetch a feed and apply it if it changed
+        :return: (changed candidates, changed places), or None if nothing changed
+        """
+        headers = {}
+        if feed.etag:
+            headers['If-None-Match'] = feed.etag
+        if feed.last_modified:
+            headers['If-Modified-Since'] = feed.last_modified
+        response = await self.http.get(feed.url, headers=headers)
+        if response.status != 200 or response.body == feed.body:
+            return None
+        race = json.loads(response.body)['data']['races'][0]
+        feed.etag = response.headers.get('ETag')
+        feed.last_modified = response.headers.get('Last-Modified')
+        feed.body = response.body
+        return feed.update(race)
+
+    async def poll(self, feed):
+        first = feed.race is None
+        while True:
+            try:
+                diff = await self.fetch(feed)
+                if diff is not None and not first and (diff[0] or diff[1]) and self.listener is not None:
+                    await self.listener(feed, *diff)
+                first = first and feed.race is None
+            except Exception as e:
+                print(feed.name + ' results poll failed: ' + repr(e))
+            await asyncio.sleep(feed.interval)
+
+    async def run(self):
+        await asyncio.gather(*[self.poll(feed) for feed in self.feeds.values()])
@@ -0,0 +1,336 @@
+import heapq
+import json
+import re
+from collections import Counter
+import numpy as np
+
+
+MARKET_FIELDS = ('id', 'name', 'shortName', 'url', 'contracts')
+CONTRACT_FIELDS = ('id', 'name', 'shortName', 'lastTradePrice', 'bestBuyYesCost', 'bestBuyNoCost')
+
+
+def keep_fields(obj):
+    if 'contracts' in obj:
+        fields = MARKET_FIELDS
+    elif 'bestBuyNoCost' in obj:
+        fields = CONTRACT_FIELDS
+    else:
+        return obj
+    return {field: obj[field] for field in fields if field in obj}
+
+
+def parse_marketdata(body):
+    """
+    Parse a marketdata/all body keeping only the fields the bot reads.
+    Each object is trimmed as soon as the decoder finishes it, so the full payload never sits in memory as dicts.
+    :param body: raw response bytes
+    :return: dict with the trimmed markets list
+    """
+    return json.loads(body, object_hook=keep_fields)
+
+
+def normalize(name):
+    return re.sub(r'[^\w\s]', '', name).lower()
+
+
+LATIN_1 = dict.fromkeys(range(128, 256))
+
+
+def sort_tokens(name):
+    """
+    Same as fuzzywuzzy's token sort preprocessing, full_process with force_ascii, without importing it:
+    characters 128 to 255 are dropped and any non word character splits words
+    """
+    return ' '.join(sorted(re.sub(r'\W', ' ', name.translate(LATIN_1)).lower().split()))
+
+
+class TokenIndex:
+    """
+    Inverted index from whitespace separated tokens to entry positions.
+    Every token is also indexed by each of its substrings of up to three characters, so a substring
+    query only checks the tokens that share its rarest trigram instead of the whole vocabulary.
+    """
+
+    GRAM = 3
+
+    def __init__(self):
+        self.postings = {}
+        self.grams = {}
+        self.entries = []
+        self.size = 0
+
+    def add(self, text):
+        tokens = frozenset(text.split())
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = []
+                self.index_token(token)
+            posting.append(self.size)
+        self.entries.append(tokens)
+        self.size += 1
+
+    def index_token(self, token):
+        for n in range(1, self.GRAM + 1):
+            for i in range(len(token) - n + 1):
+                self.grams.setdefault(token[i:i + n], set()).add(token)
+
+    def tokens_containing(self, word):
+        """
+        :param word: word without whitespace
+        :return: set of indexed tokens with the word anywhere in them
+        """
+        if len(word) <= self.GRAM:
+            return self.grams.get(word, set())
+        rarest = min((self.grams.get(word[i:i + self.GRAM], ()) for i in range(len(word) - self.GRAM + 1)), key=len)
+        return {token for token in rarest if word in token}
+
+    def containing(self, word):
+        """
+        Find every entry with the word anywhere in its text
+        :param word: word without whitespace
+        :return: set of entry positions
+        """
+        positions = set()
+        for token in self.tokens_containing(word):
+            positions.update(self.postings[token])
+        return positions
+
+    def search(self, words, limit=None):
+        """
+        Find the entries containing every word, in the order they were added.
+        Walks the postings of the rarest word in order and stops after limit entries.
+        :param words: list of words without whitespace
+        :param limit: only return this many of the first entries
+        :return: list of entry positions
+        """
+        if not words:
+            positions = range(self.size)
+            return list(positions if limit is None else positions[:limit])
+        matches = sorted((self.tokens_containing(word) for word in set(words)),
+                         key=lambda tokens: sum(len(self.postings[token]) for token in tokens))
+        if not all(matches):
+            return []
+        others = matches[1:]
+        positions = []
+        previous = -1
+        for position in heapq.merge(*[self.postings[token] for token in matches[0]]):
+            if position == previous:
+                continue
+            previous = position
+            if all(not self.entries[position].isdisjoint(tokens) for tokens in others):
+                positions.append(position)
+                if len(positions) == limit:
+                    break
+        return positions
+
+
+class SearchIndex:
+    """
+    Market name index answering the same queries as a full get_market_id scan
+    """
+
+    def __init__(self, markets):
+        self.ids = []
+        self.sorted_names = []
+        self.exact = {}
+        self.words = TokenIndex()
+        for market in markets:
+            short_name = normalize(market['shortName'])
+            long_name = normalize(market['name'])
+            self.ids.append(market['id'])
+            self.sorted_names.append((sort_tokens(short_name), sort_tokens(long_name)))
+            self.exact.setdefault(short_name, market['id'])
+            self.exact.setdefault(long_name, market['id'])
+            self.words.add(short_name + ' ' + long_name)
+
+    def find(self, guess):
+        """
+        Find the market whose name best matches a guess
+        :param guess: market name typed by a user
+        :return: market id, or 0 if nothing resembles the guess
+        """
+        from fuzzywuzzy import fuzz
+
+        guess = normalize(guess)
+        if guess in self.exact:
+            return self.exact[guess]
+        matches = Counter()
+        for word in guess.split():
+            matches.update(self.words.containing(word))
+        most_matches = max(matches.values(), default=0)
+        if most_matches:
+            candidates = sorted(position for position, n in matches.items() if n == most_matches)
+        else:
+            candidates = range(len(self.ids))
+        sorted_guess = sort_tokens(guess)
+        best_diff = -1 if most_matches else 0
+        best_diff_id = 0
+        for position in candidates:
+            short_name, long_name = self.sorted_names[position]
+            diff = max(fuzz.ratio(sorted_guess, short_name), fuzz.ratio(sorted_guess, long_name))
+            if diff > best_diff:
+                best_diff = diff
+                best_diff_id = self.ids[position]
+        return best_diff_id
+
+
+class Columns:
+    """
+    Contract prices of one snapshot as flat arrays, missing prices stored as nan.
+    Market i owns the contracts offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, markets):
+        self.market_ids = np.array([market['id'] for market in markets], dtype=np.int64)
+        counts = [len(market['contracts']) for market in markets]
+        self.offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        contracts = [contract for market in markets for contract in market['contracts']]
+        self.contract_ids = np.array([contract['id'] for contract in contracts], dtype=np.int64)
+        self.yes = np.array([contract['bestBuyYesCost'] for contract in contracts], dtype=float)
+        self.no = np.array([contract['bestBuyNoCost'] for contract in contracts], dtype=float)
+        self.last = np.array([contract['lastTradePrice'] for contract in contracts], dtype=float)
+        self.market_positions = {str(id): i for i, id in enumerate(self.market_ids.tolist())}
+
+    def position(self, market_id, bin):
+        """
+        Flat index of a market's bin, or -1 when either does not exist
+        """
+        i = self.market_positions.get(str(market_id))
+        if i is None or not 0 <= bin < self.offsets[i + 1] - self.offsets[i]:
+            return -1
+        return int(self.offsets[i] + bin)
+
+    def short(self):
+        """
+        No price of every contract with 1 where there is none, as optimize_spread expects
+        """
+        return np.where(np.isnan(self.no), 1.0, self.no)
+
+    def negative_risk_candidates(self):
+        """
+        Positions of the markets that could have negative risk. A spread can only
+        profit when the sum of 1 minus no over the market is above 1, so the rest
+        are skipped without running optimize_spread.
+        """
+        total = np.concatenate(([0.0], np.cumsum(1 - self.short())))
+        sums = total[self.offsets[1:]] - total[self.offsets[:-1]]
+        counts = np.diff(self.offsets)
+        return np.flatnonzero((counts > 1) & (sums > 1 - 1e-9))
+
+    def short_prices(self, market_ids=None, candidates_only=False):
+        """
+        Compact picklable view of every market with more than one contract
+        :param market_ids: only include these markets
+        :param candidates_only: leave out markets that cannot have negative risk
+        :return: list of (market id, list of no price of each contract, 1 when there is none)
+        """
+        if candidates_only:
+            positions = self.negative_risk_candidates()
+        else:
+            positions = np.flatnonzero(np.diff(self.offsets) > 1)
+        if market_ids is not None:
+            wanted = [self.market_positions[str(id)] for id in market_ids if str(id) in self.market_positions]
+            positions = np.intersect1d(positions, wanted)
+        short = self.short()
+        offsets = self.offsets
+        return [(int(self.market_ids[i]), short[offsets[i]:offsets[i + 1]].tolist()) for i in positions]
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.market_ids, self.offsets, self.contract_ids, self.yes, self.no,
+                                              self.last))
+
+
+class SnapshotDiff:
+    """
+    Markets and contracts that differ between two snapshots
+    """
+
+    def __init__(self, previous, current):
+        previous_markets = previous.markets if previous is not None else {}
+        self.added = [id for id in current.markets if id not in previous_markets]
+        self.removed = [id for id in previous_markets if id not in current.markets]
+        self.changed = {}
+        for id, market in current.markets.items():
+            old = previous_markets.get(id)
+            if old is None:
+                self.changed[id] = [str(contract['id']) for contract in market['contracts']]
+            elif old != market:
+                old_contracts = {str(contract['id']): contract for contract in old['contracts']}
+                self.changed[id] = [str(contract['id']) for contract in market['contracts']
+                                    if old_contracts.get(str(contract['id'])) != contract]
+
+    def renamed(self, previous, current):
+        """
+        Check whether any market or contract name differs, which invalidates the name indexes
+        """
+        if self.added or self.removed or list(previous.markets) != list(current.markets):
+            return True
+        for id in self.changed:
+            old = previous.markets[id]
+            new = current.markets[id]
+            if old['name'] != new['name'] or old['shortName'] != new['shortName']:
+                return True
+            if [contract['name'] for contract in old['contracts']] != [contract['name'] for contract in new['contracts']]:
+                return True
+        return False
+
+    def __bool__(self):
+        return bool(self.changed or self.removed)
+
+
+class MarketStore:
+    """
+    Lookup tables over one /api/marketdata/all snapshot.
+    Given the previous store, only the markets that changed are compared and
+    the name indexes are reused when no name changed.
+    """
+
+    def __init__(self, data, previous=None):
+        self.data = data
+        self.markets = {}
+        self.contracts = {}
+        self.contract_markets = {}
+        self.contract_list = []
+        for market in data['markets']:
+            self.markets[str(market['id'])] = market
+            for contract in market['contracts']:
+                self.contracts[str(contract['id'])] = contract
+                self.contract_markets[str(contract['id'])] = market
+                self.contract_list.append(contract)
+        self.columns = Columns(data['markets'])
+        self.diff = SnapshotDiff(previous, self)
+        if previous is None or self.diff.renamed(previous, self):
+            self.build_indexes()
+        else:
+            self.titles = previous.titles
+            self.contract_names = previous.contract_names
+            self.search = previous.search
+
+    def build_indexes(self):
+        self.titles = TokenIndex()
+        self.contract_names = TokenIndex()
+        for market in self.data['markets']:
+            self.titles.add(market['name'].lower() + ' ' + market['shortName'].lower())
+            for contract in market['contracts']:
+                self.contract_names.add(contract['name'].lower())
+        self.search = SearchIndex(self.data['markets'])
+
+    def short_prices(self, market_ids=None, candidates_only=False):
+        return self.columns.short_prices(market_ids, candidates_only)
+
+    def market(self, id):
+        return self.markets.get(str(id))
+
+    def contract(self, id):
+        return self.contracts.get(str(id))
+
+    def contract_market(self, id):
+        return self.contract_markets.get(str(id))
+
+    def __iter__(self):
+        return iter(self.markets.values())
+
+    def __len__(self):
+        return len(self.markets)
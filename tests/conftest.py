@@ -0,0 +1,125 @@
+import asyncio
+import os
+import sys
+import types
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURES, name)
+
+
+def run(coroutine):
+    """
+    Run a test coroutine on a fresh loop, cancelling whatever background tasks it left behind
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+
+@pytest.fixture
+def auths(monkeypatch):
+    """
+    Credentials module Api.login imports, in place of the untracked auths.py
+    """
+    module = types.ModuleType('auths')
+    module.username = 'bot@example.com'
+    module.password = 'secret'
+    monkeypatch.setitem(sys.modules, 'auths', module)
+    return module
+
+
+def contract(id, name, yes, no, last):
+    return {'id': id, 'name': name, 'shortName': name, 'lastTradePrice': last, 'bestBuyYesCost': yes,
+            'bestBuyNoCost': no}
+
+
+def marketdata():
+    small = {'id': 7001, 'name': 'Who will win the 2020 Nevada Democratic caucuses?',
+             'shortName': 'Nevada Democratic caucuses', 'url': 'https://www.predictit.org/markets/detail/7001',
+             'contracts': [contract(8001, 'Sanders', 0.71, 0.3, 0.7), contract(8002, 'Biden', 0.2, 0.81, 0.19),
+                           contract(8003, 'Steyer', None, None, None)]}
+    large = {'id': 7002, 'name': 'Who will win the 2020 Democratic presidential nomination?',
+             'shortName': '2020 Democratic nominee', 'url': 'https://www.predictit.org/markets/detail/7002',
+             'contracts': [contract(8100 + i, 'Candidate ' + str(i), 0.05, 0.96, 0.04) for i in range(25)]}
+    return {'markets': [small, large]}
+
+
+class PredictItStub:
+    """
+    Local stand-in for the PredictIt endpoints the Api calls. Every login issues a new token
+    and only the latest one is accepted; revoke() makes the server refuse it until the next login.
+    """
+
+    def __init__(self):
+        self.data = marketdata()
+        self.version = 1
+        self.logins = 0
+        self.token = None
+        self.broken = set()
+        self.requests = []
+        self.runner = None
+        self.base_url = None
+
+    def revoke(self):
+        self.token = None
+
+    async def login(self, request):
+        self.logins += 1
+        self.token = 'token-' + str(self.logins)
+        return web.json_response({'access_token': self.token, 'expires_in': 1209599})
+
+    async def marketdata(self, request):
+        self.requests.append(('marketdata', dict(request.headers)))
+        etag = '"' + str(self.version) + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304)
+        return web.json_response(self.data, headers={'ETag': etag})
+
+    async def orderbook(self, request):
+        id = int(request.match_info['id'])
+        self.requests.append(('orderbook', id))
+        if self.token is None or request.headers.get('Authorization') != 'Bearer ' + self.token:
+            return web.Response(status=401)
+        if id in self.broken:
+            return web.Response(status=500, text='server error')
+        return web.json_response({'yesOrders': [{'pricePerShare': 0.42, 'quantity': 10}],
+                                  'noOrders': [{'pricePerShare': 0.6, 'quantity': 5}]})
+
+    async def contracts(self, request):
+        id = int(request.match_info['id'])
+        self.requests.append(('contracts', id))
+        market = next(market for market in self.data['markets'] if market['id'] == id)
+        return web.json_response([{'contractName': contract['name'], 'bestYesPrice': contract['bestBuyYesCost'],
+                                   'bestNoPrice': contract['bestBuyNoCost']} for contract in market['contracts']])
+
+    def count(self, kind):
+        return sum(1 for request in self.requests if request[0] == kind)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/api/Account/token', self.login)
+        app.router.add_get('/api/marketdata/all', self.marketdata)
+        app.router.add_get('/api/Trade/{id}/OrderBook', self.orderbook)
+        app.router.add_get('/api/Market/{id}/Contracts', self.contracts)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        self.base_url = 'http://127.0.0.1:' + str(self.runner.addresses[0][1]) + '/api/'
+        return self
+
+    async def close(self):
+        await self.runner.cleanup()
@@ -0,0 +1,29 @@
+return_json({
+ "poll": {
+  "id": 6730,
+  "title": "2020 Democratic Presidential Nomination",
+  "rcp_avg": [
+   {
+    "date": "Tue, 11 Feb 2020 00:00:00 -0600",
+    "candidate": [
+     {"id": "1", "name": "Sanders", "value": "23.0"},
+     {"id": "2", "name": "Biden", "value": "22.0"},
+     {"id": "3", "name": "Bloomberg", "value": "14.2"},
+     {"id": "4", "name": "Steyer", "value": ""}
+    ]
+   },
+   {
+    "date": "Mon, 10 Feb 2020 00:00:00 -0600",
+    "candidate": [
+     {"id": "1", "name": "Sanders", "value": "22.4"},
+     {"id": "2", "name": "Biden", "value": "23.6"},
+     {"id": "3", "name": "Bloomberg", "value": "13.8"},
+     {"id": "4", "name": "Steyer", "value": "2.1"}
+    ]
+   }
+  ],
+  "poll": [
+   {"pollster": "Monmouth", "date": "2/6 - 2/9", "candidate": [{"name": "Sanders", "value": "26"}]}
+  ]
+ }
+});
@@ -0,0 +1,76 @@
+import copy
+from alerts import AlertEngine
+from conftest import marketdata
+from store import MarketStore
+
+
+def snapshot(previous=None, **yes):
+    """
+    Next snapshot with the yes price of some contracts replaced, e.g. snapshot(store, c8001=0.8)
+    """
+    data = copy.deepcopy(previous.data if previous is not None else marketdata())
+    for market in data['markets']:
+        for contract in market['contracts']:
+            if 'c' + str(contract['id']) in yes:
+                contract['bestBuyYesCost'] = yes['c' + str(contract['id'])]
+    return MarketStore(data, previous)
+
+
+def check(engine, store, diff=True):
+    return [id for id, msg in engine.check(store.columns, store.diff if diff else None)]
+
+
+def test_rising_alert_fires_once_at_threshold():
+    engine = AlertEngine()
+    alert = engine.add('<@1>', 7001, 0, 75)
+    store = snapshot()
+    assert check(engine, store) == []
+    store = snapshot(store, c8001=0.74)
+    assert check(engine, store) == []
+    store = snapshot(store, c8001=0.75)
+    assert check(engine, store) == [alert['id']]
+    store = snapshot(store, c8001=0.9)
+    assert check(engine, store) == []
+    assert len(engine) == 0
+
+
+def test_falling_alert_fires_when_price_drops_to_threshold():
+    engine = AlertEngine()
+    alert = engine.add('<@1>', 7001, 1, -15)
+    store = snapshot()
+    assert check(engine, store) == []
+    store = snapshot(store, c8002=0.15)
+    assert check(engine, store) == [alert['id']]
+    assert 'dropped below 15' in engine.pending()[0][1]
+
+
+def test_new_alert_is_checked_without_a_diff_touching_its_market():
+    engine = AlertEngine()
+    store = snapshot()
+    check(engine, store)
+    store = snapshot(store, c8100=0.06)
+    alert = engine.add('<@1>', 7001, 0, 50)
+    assert list(store.diff.changed) == ['7002']
+    assert check(engine, store) == [alert['id']]
+
+
+def test_only_changed_markets_are_checked_after_the_first_check():
+    engine = AlertEngine()
+    alert = engine.add('<@1>', 7001, 0, 80)
+    store = snapshot()
+    check(engine, store)
+    unrelated = snapshot(store, c8100=0.06)
+    unrelated.columns.yes[unrelated.columns.position(7001, 0)] = 0.85
+    assert check(engine, unrelated) == []
+    assert check(engine, unrelated, diff=False) == [alert['id']]
+
+
+def test_missing_bin_and_price_never_fire():
+    engine = AlertEngine()
+    engine.add('<@1>', 7001, 9, 1)
+    engine.add('<@1>', 7001, 2, 1)
+    engine.add('<@1>', 9999, 0, 1)
+    store = snapshot()
+    assert check(engine, store) == []
+    assert check(engine, store, diff=False) == []
+    assert len(engine) == 3
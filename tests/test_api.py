@@ -0,0 +1,88 @@
+import main
+from conftest import PredictItStub, run
+
+
+async def started(stub):
+    api = main.Api(stub.base_url, alert_path=None, history_path=None, cache_path=None, processes=1)
+    await api.start()
+    await api.wait_loaded()
+    return api
+
+
+async def stop(api, stub):
+    api.workers.close()
+    await api.http.close()
+    await stub.close()
+
+
+def test_reload_sends_etag_and_skips_unchanged_snapshot():
+    async def check():
+        stub = await PredictItStub().start()
+        api = await started(stub)
+        try:
+            unchanged = await api.reload()
+            stub.data['markets'][0]['contracts'][0]['bestBuyYesCost'] = 0.75
+            stub.version = 2
+            changed = await api.reload()
+        finally:
+            await stop(api, stub)
+        return stub, api, unchanged, changed
+
+    stub, api, unchanged, changed = run(check())
+    assert unchanged is None
+    assert stub.requests[1][1]['If-None-Match'] == '"1"'
+    assert list(changed.changed) == ['7001']
+    assert api.store.contract(8001)['bestBuyYesCost'] == 0.75
+
+
+def test_get_all_offers_is_cached():
+    async def check():
+        stub = await PredictItStub().start()
+        api = await started(stub)
+        try:
+            first = await api.get_all_offers(7001)
+            second = await api.get_all_offers(7001)
+        finally:
+            await stop(api, stub)
+        return stub, first, second
+
+    stub, first, second = run(check())
+    assert first == {'Sanders': {'yes_cost': 0.71, 'no_cost': 0.3}, 'Biden': {'yes_cost': 0.2, 'no_cost': 0.81},
+                     'Steyer': {'yes_cost': None, 'no_cost': 1}}
+    assert second == first
+    assert stub.count('contracts') == 1
+
+
+def test_get_orderbook_logs_in_once(auths):
+    async def check():
+        stub = await PredictItStub().start()
+        api = await started(stub)
+        try:
+            first = await api.get_orderbook(8001)
+            second = await api.get_orderbook(8001)
+        finally:
+            await stop(api, stub)
+        return stub, first, second
+
+    stub, first, second = run(check())
+    assert first['yesOrders'] == [{'pricePerShare': 0.42, 'quantity': 10}]
+    assert second == first
+    assert stub.logins == 1
+    assert stub.count('orderbook') == 1
+
+
+def test_market_orderbooks_survive_one_failing_book(auths):
+    async def check():
+        stub = await PredictItStub().start()
+        stub.broken.add(8105)
+        api = await started(stub)
+        try:
+            bins = await api.get_market_orderbooks(7002, top=True)
+        finally:
+            await stop(api, stub)
+        return bins
+
+    bins = run(check())
+    assert len(bins) == 25
+    assert bins['Candidate 5'] is None
+    assert all(bins[name] == {'yes': [(0.42, 10)], 'no': [(0.6, 5)]} for name in bins if name != 'Candidate 5')
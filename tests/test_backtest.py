@@ -0,0 +1,20 @@
+import os
+from alerts import AlertEngine
+from backtest import saved_alerts
+from journal import Journal
+
+
+def test_saved_alerts_leaves_live_journal_untouched(tmp_path):
+    path = str(tmp_path / 'alerts')
+    engine = AlertEngine(Journal(path))
+    engine.add('<@1>', 5000, 0, 60)
+    engine.add('<@2>', 5001, 1, -40)
+    engine.flush()
+    with open(path + '.log', 'a') as f:
+        f.write('{"op": "add", "alert": {"id": 2')
+    with open(path + '.log', 'rb') as f:
+        before = f.read()
+    assert saved_alerts(path) == [('<@1>', 5000, 0, 60), ('<@2>', 5001, 1, -40)]
+    with open(path + '.log', 'rb') as f:
+        assert f.read() == before
+    assert not os.path.exists(path + '.snapshot')
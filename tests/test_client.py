@@ -0,0 +1,70 @@
+import asyncio
+import aiohttp
+import pytest
+import main
+from client import TokenManager
+from conftest import PredictItStub, run
+
+
+def test_revoked_token_during_fan_out_costs_one_login(auths):
+    async def check():
+        stub = await PredictItStub().start()
+        api = main.Api(stub.base_url, alert_path=None, history_path=None, cache_path=None, processes=1)
+        await api.start()
+        await api.wait_loaded()
+        try:
+            await api.tokens.get()
+            stub.revoke()
+            bins = await api.get_market_orderbooks(7002, top=True)
+        finally:
+            api.workers.close()
+            await api.http.close()
+            await stub.close()
+        return stub, bins
+
+    stub, bins = run(check())
+    assert len(bins) == 25
+    assert all(offers is not None for offers in bins.values())
+    assert stub.logins == 2
+
+
+def test_login_retries_with_backoff():
+    async def check():
+        attempts = []
+
+        async def login():
+            attempts.append(asyncio.get_event_loop().time())
+            if len(attempts) < 3:
+                raise aiohttp.ClientConnectionError('login refused')
+            return 'token', 3600
+
+        tokens = TokenManager(login, retries=3, backoff=0.05)
+        return await tokens.get(), attempts
+
+    token, attempts = run(check())
+    assert token == 'token'
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.05
+    assert attempts[2] - attempts[1] >= 0.1
+
+
+def test_login_gives_up_after_retries_and_tries_again_later():
+    async def check():
+        attempts = []
+
+        async def login():
+            attempts.append(1)
+            if len(attempts) <= 3:
+                raise asyncio.TimeoutError()
+            return 'token', 3600
+
+        tokens = TokenManager(login, retries=2, backoff=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await tokens.get()
+        failed = len(attempts)
+        return failed, await tokens.get(), len(attempts)
+
+    failed, token, total = run(check())
+    assert failed == 3
+    assert token == 'token'
+    assert total == 4
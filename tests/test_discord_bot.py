@@ -0,0 +1,13 @@
+from discord_bot import chunk_messages
+
+
+def test_chunks_fill_up_to_the_limit():
+    chunks = chunk_messages([(0, 'a' * 10), (1, 'b' * 10), (2, 'c' * 10)], limit=30)
+    assert chunks == [('a' * 10 + '\n\n' + 'b' * 10 + '\n\n', [0, 1]), ('c' * 10 + '\n\n', [2])]
+
+
+def test_oversized_message_is_cut_and_never_sent_empty():
+    chunks = chunk_messages([(0, 'x' * 2500), (1, 'short')])
+    assert [ids for content, ids in chunks] == [[0], [1]]
+    assert all(content and len(content) <= 2000 for content, ids in chunks)
+    assert chunks[0][0].endswith('...\n\n')
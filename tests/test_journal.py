@@ -0,0 +1,67 @@
+import os
+import shutil
+from alerts import AlertEngine
+from journal import Journal
+
+
+def restart(path, **kwargs):
+    return AlertEngine(Journal(path), **kwargs)
+
+
+def state(engine):
+    return sorted(alert['id'] for alert in engine.watches()), sorted(engine.pending())
+
+
+def fire(engine, market, bin, cents):
+    return engine.fire((str(market), bin), cents)
+
+
+def test_replay_across_compaction(tmp_path):
+    path = str(tmp_path / 'alerts')
+    engine = restart(path, compact_every=3)
+    for value in (10, 20, 30, 40):
+        engine.add('<@1>', 7001, 0, value)
+    engine.flush()
+    assert os.path.exists(path + '.snapshot')
+    fired = fire(engine, 7001, 0, 25)
+    engine.delivered(fired[0][0])
+    engine.add('<@2>', 7001, 1, -5)
+    engine.flush()
+    before = state(engine)
+    engine = restart(path)
+    assert state(engine) == before
+    assert engine.add('<@3>', 7001, 0, 90)['id'] == 5
+
+
+def test_log_written_before_a_compaction_is_not_replayed_twice(tmp_path):
+    path = str(tmp_path / 'alerts')
+    engine = restart(path, compact_every=1000)
+    engine.add('<@1>', 7001, 0, 10)
+    engine.add('<@1>', 7001, 0, 20)
+    engine.flush()
+    shutil.copy(path + '.log', str(tmp_path / 'old.log'))
+    fire(engine, 7001, 0, 15)
+    engine.journal.flush()
+    engine.journal.compact({'alerts': engine.all_alerts(), 'outbox': engine.outbox})
+    shutil.copy(str(tmp_path / 'old.log'), path + '.log')
+    assert state(restart(path)) == state(engine)
+
+
+def test_torn_tail_is_skipped_and_cut_by_the_next_flush(tmp_path):
+    path = str(tmp_path / 'alerts')
+    engine = restart(path)
+    engine.add('<@1>', 7001, 0, 10)
+    engine.flush()
+    with open(path + '.log', 'a') as f:
+        f.write('{"op": "add", "alert": {"id": 1, "us')
+    torn = os.path.getsize(path + '.log')
+    engine = restart(path)
+    assert len(engine) == 1
+    assert os.path.getsize(path + '.log') == torn
+    engine.add('<@1>', 7001, 0, 20)
+    fire(engine, 7001, 0, 15)
+    engine.flush()
+    engine = restart(path)
+    assert len(engine) == 1
+    assert [id for id, msg in engine.pending()] == [0]
+    assert engine.add('<@1>', 7001, 0, 30)['id'] == 2
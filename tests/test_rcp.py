@@ -0,0 +1,71 @@
+import asyncio
+from aiohttp import web
+from client import HttpClient
+from conftest import fixture_path
+from rcp import RcpService, parse_average
+
+
+def read_fixture():
+    with open(fixture_path('6730_historical.js'), 'rb') as f:
+        return f.read()
+
+
+async def serve(body, requests):
+    """
+    Serve body as every RCP historical file on a free local port
+    :param requests: list the requested paths are appended to
+    :return: (runner to clean up, base url)
+    """
+    async def historical(request):
+        requests.append(request.path)
+        return web.Response(body=body, content_type='application/javascript')
+
+    app = web.Application()
+    app.router.add_get('/epolls/json/{name}', historical)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, 'http://127.0.0.1:' + str(runner.addresses[0][1]) + '/epolls/json/'
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_parse_average_reads_latest_average():
+    assert parse_average(read_fixture()) == [('Sanders', '23.0'), ('Biden', '22.0'), ('Bloomberg', '14.2')]
+
+
+def test_region_lookup():
+    service = RcpService(HttpClient())
+    assert service.region('NH').title == 'New Hampshire'
+    assert service.region(' New Hampshire ') is service.region('nh')
+    assert service.region('ohio') is None
+    assert 'national' in service.names().split(', ')
+
+
+def test_latest_reuses_cache():
+    async def check():
+        requests = []
+        runner, base_url = await serve(read_fixture(), requests)
+        http = HttpClient()
+        try:
+            service = RcpService(http, base_url)
+            first = await service.latest('nation')
+            second = await service.latest('national')
+            unknown = await service.latest('ohio')
+        finally:
+            await http.close()
+            await runner.cleanup()
+        return requests, first, second, unknown
+
+    requests, first, second, unknown = run(check())
+    assert first == ('RCP average for the nation', [('Sanders', '23.0'), ('Biden', '22.0'), ('Bloomberg', '14.2')])
+    assert second == first
+    assert unknown is None
+    assert requests == ['/epolls/json/6730_historical.js']
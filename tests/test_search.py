@@ -0,0 +1,15 @@
+import json
+import pytest
+from conftest import fixture_path
+from store import SearchIndex
+
+# Market names with the id the full scan get_market_id returned for each guess, before SearchIndex replaced it
+with open(fixture_path('market_names.json')) as f:
+    FIXTURE = json.load(f)
+
+INDEX = SearchIndex(FIXTURE['markets'])
+
+
+@pytest.mark.parametrize('case', FIXTURE['guesses'], ids=lambda case: case['guess'])
+def test_find_matches_recorded(case):
+    assert INDEX.find(case['guess']) == case['id']
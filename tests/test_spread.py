@@ -0,0 +1,15 @@
+import json
+import pytest
+from conftest import fixture_path
+from main import optimize_spread
+
+# Inputs and results recorded from the loop based optimize_spread this implementation replaced
+with open(fixture_path('spreads.json')) as f:
+    CASES = json.load(f)
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_optimize_spread_matches_recorded(case):
+    spread, profit = optimize_spread(case['prices'], case['max_shares'], case['minimum'])
+    assert spread == case['spread']
+    assert profit == pytest.approx(case['profit'], abs=1e-9)
@@ -0,0 +1,42 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+class Workers:
+    """
+    Process pool for CPU-bound analytics, so a long scan never holds the event loop.
+    Workers start from a forkserver rather than a fork of the bot, which runs threads and holds sockets.
+    Each worker imports the entry script again, so scripts keep their startup under if __name__ == '__main__'.
+    """
+
+    def __init__(self, processes=None, timeout=30, start_method='forkserver'):
+        self.processes = processes
+        self.timeout = timeout
+        self.start_method = start_method
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context(self.start_method))
+        return self.pool
+
+    def size(self):
+        return self.processes or os.cpu_count() or 1
+
+    async def run(self, function, *args, timeout=None):
+        """
+        Run a picklable module level function in a worker process
+        :param timeout: seconds before the call is cancelled, defaults to self.timeout
+        :raises asyncio.TimeoutError: when the call takes longer than the timeout
+        """
+        future = self.get_pool().submit(function, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        finally:
+            future.cancel()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)